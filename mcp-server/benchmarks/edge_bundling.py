@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Edge-bundling benchmark for create_system_architecture.
+
+Generates a wide microservice-style diagram (gateways fanning out to many
+services, services fanning in to shared stores, plus duplicate connections)
+with ~1k connections and compares element count and build time with and
+without edge bundling. Exits non-zero if bundling is over its time budget or
+fails to reduce the element count.
+
+Usage:
+    python benchmarks/edge_bundling.py [--edges 1000] [--runs 5] [--budget-ms 150]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_system_architecture  # noqa: E402
+
+BUDGET_MS = 150
+
+
+def generate_architecture(edge_count: int, seed: int = 0) -> tuple[list[dict], list[dict]]:
+    """Build a layered client -> gateway -> service -> store graph with about `edge_count` connections"""
+    rng = random.Random(seed)
+    services = max(4, edge_count // 4)
+    gateways = max(1, services // 50)
+    stores = max(2, services // 25)
+
+    components = [{"id": "client", "type": "client", "label": "Clients", "layer": 0}]
+    components += [{"id": f"gw{i}", "type": "server", "label": f"Gateway {i}", "layer": 1} for i in range(gateways)]
+    components += [{"id": f"svc{i}", "type": "service", "label": f"Service {i}", "layer": 2} for i in range(services)]
+    components += [{"id": f"db{i}", "type": "database", "label": f"Store {i}", "layer": 3} for i in range(stores)]
+
+    connections = [{"from": "client", "to": f"gw{i}", "label": "HTTPS"} for i in range(gateways)]
+    while len(connections) < edge_count:
+        svc = rng.randrange(services)
+        roll = rng.random()
+        if roll < 0.4:
+            connections.append({"from": f"gw{svc % gateways}", "to": f"svc{svc}"})
+        elif roll < 0.9:
+            connections.append({"from": f"svc{svc}", "to": f"db{rng.randrange(stores)}", "label": "SQL"})
+        else:
+            # Peer calls inside the service layer stay unbundled
+            connections.append({"from": f"svc{svc}", "to": f"svc{rng.randrange(services)}", "label": "gRPC"})
+    return components, connections
+
+
+def measure(components: list[dict], connections: list[dict], bundle: bool, runs: int) -> tuple[float, int]:
+    samples = []
+    count = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = create_system_architecture(components, connections, bundleEdges=bundle)
+        samples.append((time.perf_counter() - start) * 1000)
+        count = len(result["elements"])
+    return statistics.median(samples), count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edges", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    components, connections = generate_architecture(args.edges)
+    plain_ms, plain_count = measure(components, connections, False, args.runs)
+    bundled_ms, bundled_count = measure(components, connections, True, args.runs)
+
+    print(f"{len(components)} components, {len(connections)} connections")
+    print(f"unbundled: {plain_ms:8.1f} ms  {plain_count:6d} elements")
+    print(f"bundled:   {bundled_ms:8.1f} ms  {bundled_count:6d} elements  (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if bundled_ms > args.budget_ms:
+        print("FAIL: bundled build over budget")
+        failed = True
+    if bundled_count >= plain_count:
+        print("FAIL: bundling did not reduce element count")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Label-placement benchmark.
+
+Lays out a grid of boxes where every box connects to its right and lower
+neighbour (plus a few random long edges), labels every edge, and times
+place_labels(). Reports how many labels still overlap a shape or another
+label, and exits non-zero if placement exceeds its time budget.
+
+Usage:
+    python benchmarks/label_placement.py [--labels 5000] [--runs 3] [--budget-ms 1000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import measure_text, place_labels  # noqa: E402
+
+BUDGET_MS = 1000
+
+
+def generate_diagram(label_count: int, seed: int = 0) -> tuple[list[dict], list[tuple], list[list]]:
+    """Grid of 160x60 boxes with labelled edges to right/lower neighbours"""
+    rng = random.Random(seed)
+    side = max(2, int((label_count / 2) ** 0.5) + 1)
+    boxes = {}
+    for row in range(side):
+        for col in range(side):
+            x, y = col * 260, row * 140
+            boxes[(row, col)] = (x, y, x + 160, y + 60)
+
+    paths = []
+    labels = []
+    for (row, col), (x1, y1, x2, y2) in boxes.items():
+        if len(labels) >= label_count:
+            break
+        for neighbour in ((row, col + 1), (row + 1, col)):
+            if neighbour not in boxes or len(labels) >= label_count:
+                continue
+            nx1, ny1, nx2, ny2 = boxes[neighbour]
+            if neighbour[1] > col:
+                points = [(x2, (y1 + y2) / 2), (nx1, (ny1 + ny2) / 2)]
+            else:
+                points = [((x1 + x2) / 2, y2), ((nx1 + nx2) / 2, ny1)]
+            paths.append(points)
+            labels.append({'text': rng.choice(["YES", "NO", "HTTPS", "SQL", "events"]), 'points': points})
+
+    # A few long diagonal edges crossing the grid
+    keys = list(boxes)
+    for _ in range(side):
+        a, b = boxes[rng.choice(keys)], boxes[rng.choice(keys)]
+        paths.append([(a[2], a[3]), (b[0], b[1])])
+
+    return labels, list(boxes.values()), paths
+
+
+def count_conflicts(labels: list[dict], placements: list[tuple], obstacles: list[tuple]) -> int:
+    """Labels whose box overlaps a shape or an earlier label (O(n^2), for reporting only on small n)"""
+    placed = []
+    conflicts = 0
+    for label, (cx, cy) in zip(labels, placements):
+        w, h = measure_text(label['text'], 16)
+        box = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+        if any(min(box[2], o[2]) > max(box[0], o[0]) and min(box[3], o[3]) > max(box[1], o[1])
+               for o in obstacles + placed):
+            conflicts += 1
+        placed.append(box)
+    return conflicts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--labels", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    labels, obstacles, paths = generate_diagram(args.labels)
+    samples = []
+    placements = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        placements = place_labels(labels, obstacles, paths)
+        samples.append((time.perf_counter() - start) * 1000)
+    placement_ms = statistics.median(samples)
+
+    print(f"{len(labels)} labels, {len(obstacles)} shapes, {len(paths)} edges")
+    print(f"placement: {placement_ms:8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    if len(labels) <= 2000:
+        print(f"conflicts: {count_conflicts(labels, placements, obstacles)}")
+
+    if placement_ms > args.budget_ms:
+        print("FAIL: placement over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
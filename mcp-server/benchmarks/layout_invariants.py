@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Randomized correctness and performance checks for the diagram layouts.
+
+Generates random flowcharts and architectures at several sizes and checks
+that the output of create_advanced_flowchart and create_system_architecture
+keeps its structural invariants:
+
+  * every node is drawn exactly once
+  * no two node boxes on the same level overlap
+  * every containerId has a matching boundElements entry and vice versa
+  * every edge is drawn by its own connector, whose endpoints lie on the
+    boxes of that edge's source and target (or of its bundle hub and spokes)
+
+Each size also has a wall-time and peak-memory ceiling (worst case over all
+seeds), so layout optimizations can be checked for both correctness and
+speed. Exits non-zero on any violation.
+
+Usage:
+    python benchmarks/layout_invariants.py [--seeds 10] [--seed-offset 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import bundle_connections, create_advanced_flowchart, create_system_architecture  # noqa: E402
+
+SHAPE_TYPES = ("rectangle", "ellipse", "diamond")
+EPSILON = 0.5
+
+# size -> (max milliseconds, max peak MiB) for one call
+FLOWCHART_CEILINGS = {10: (50, 1), 100: (150, 4), 1000: (1500, 32)}
+ARCHITECTURE_CEILINGS = {10: (50, 1), 100: (300, 4), 500: (3000, 16)}
+
+
+def random_flowchart(rng: random.Random, size: int) -> list[dict]:
+    """Forward-only flowchart: processes chain to a nearby later node, decisions branch to two"""
+    nodes = []
+    for i in range(size):
+        node = {"id": f"n{i}", "label": f"N{i}", "type": "process"}
+        last = size - 1
+        if i == 0:
+            node["type"] = "start"
+        if i == last:
+            node["type"] = "end"
+        elif rng.random() < 0.25 and i < last - 1:
+            node["type"] = "decision"
+            node["next"] = {
+                "yes": f"n{rng.randint(i + 1, min(last, i + 4))}",
+                "no": f"n{rng.randint(i + 1, min(last, i + 4))}",
+            }
+        elif rng.random() < 0.05:
+            node["type"] = "end"
+        else:
+            node["next"] = f"n{rng.randint(i + 1, min(last, i + 2))}"
+        nodes.append(node)
+    return nodes
+
+
+def random_looping_flowchart(rng: random.Random, size: int) -> list[dict]:
+    """Flowchart with retry loops: about a third of the decisions jump back to an earlier step"""
+    nodes = random_flowchart(rng, size)
+    for i, node in enumerate(nodes):
+        if node["type"] == "decision" and i > 1 and rng.random() < 0.35:
+            node["next"]["no"] = f"n{rng.randint(max(1, i - 6), i)}"
+        elif node["type"] == "process" and i > 1 and rng.random() < 0.05:
+            node["next"] = f"n{rng.randint(1, i)}"
+    return nodes
+
+
+def random_architecture(rng: random.Random, size: int) -> tuple[list[dict], list[dict]]:
+    """Layered components with random (possibly duplicate, sideways or upward) connections"""
+    types = ["client", "server", "database", "api", "cache", "queue", "storage", "service", "cloud", "user"]
+    layer_count = max(2, int(size ** 0.5) // 2)
+    components = [
+        {"id": f"c{i}", "type": rng.choice(types), "label": f"C{i}", "layer": rng.randrange(layer_count)}
+        for i in range(size)
+    ]
+    connections = []
+    for _ in range(size * 2):
+        a, b = rng.sample(range(size), 2)
+        connection = {"from": f"c{a}", "to": f"c{b}"}
+        if rng.random() < 0.5:
+            connection["label"] = rng.choice(["HTTPS", "SQL", "gRPC", "events"])
+        connections.append(connection)
+    return components, connections
+
+
+def node_boxes(elements: list[dict], labels: set[str]) -> tuple[dict, list[str]]:
+    """Map node label -> box of the shape bound to that label, collecting duplicates as errors"""
+    by_id = {e["id"]: e for e in elements}
+    # Library shapes are groups of parts; the node's box is the whole group, not just the label part
+    groups = {}
+    for element in elements:
+        if element["type"] != "text" and element.get("groupIds"):
+            if "points" in element:
+                xs = [element["x"] + px for px, _ in element["points"]]
+                ys = [element["y"] + py for _, py in element["points"]]
+                x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+            else:
+                x1, y1 = element["x"], element["y"]
+                x2, y2 = x1 + element["width"], y1 + element["height"]
+            box = groups.get(element["groupIds"][0])
+            groups[element["groupIds"][0]] = (x1, y1, x2, y2) if box is None else (
+                min(box[0], x1), min(box[1], y1), max(box[2], x2), max(box[3], y2)
+            )
+    boxes = {}
+    errors = []
+    for element in elements:
+        if element["type"] != "text" or not element.get("containerId"):
+            continue
+        container = by_id.get(element["containerId"])
+        if container is None or container["type"] not in SHAPE_TYPES:
+            continue
+        label = element["text"]
+        if label not in labels:
+            continue
+        if label in boxes:
+            errors.append(f"node {label} drawn more than once")
+        if container.get("groupIds"):
+            boxes[label] = groups[container["groupIds"][0]]
+        else:
+            boxes[label] = (container["x"], container["y"],
+                            container["x"] + container["width"], container["y"] + container["height"])
+    errors.extend(f"node {label} not drawn" for label in labels - boxes.keys())
+    return boxes, errors
+
+
+def check_bindings(elements: list[dict]) -> list[str]:
+    by_id = {e["id"]: e for e in elements}
+    errors = []
+    for element in elements:
+        container_id = element.get("containerId")
+        if container_id:
+            container = by_id.get(container_id)
+            if container is None:
+                errors.append(f"{element['id']} bound to missing container {container_id}")
+            elif not any(b["id"] == element["id"] for b in container.get("boundElements") or []):
+                errors.append(f"container {container_id} does not list bound text {element['id']}")
+        for bound in element.get("boundElements") or []:
+            target = by_id.get(bound["id"])
+            if target is None or target.get("containerId") != element["id"]:
+                errors.append(f"{element['id']} lists {bound['id']} which is not bound back to it")
+    return errors
+
+
+def check_level_overlap(boxes: dict) -> list[str]:
+    """Boxes sharing a top edge form a level; neighbours in a level must not overlap"""
+    levels = {}
+    for label, box in boxes.items():
+        levels.setdefault(round(box[1], 3), []).append((box, label))
+    errors = []
+    for row in levels.values():
+        row.sort()
+        for (a, a_label), (b, b_label) in zip(row, row[1:]):
+            if b[0] < a[2] - EPSILON:
+                errors.append(f"nodes {a_label} and {b_label} overlap")
+    return errors
+
+
+def endpoint_locator(boxes: dict):
+    """Return a function giving the labels of every node box whose border holds a point"""
+    edges = {"top": {}, "bottom": {}, "left": {}, "right": {}}
+    for label, box in boxes.items():
+        left, top, right, bottom = box
+        edges["top"].setdefault(round(top), []).append((label, box))
+        edges["bottom"].setdefault(round(bottom), []).append((label, box))
+        edges["left"].setdefault(round(left), []).append((label, box))
+        edges["right"].setdefault(round(right), []).append((label, box))
+
+    def nodes_at(px: float, py: float) -> set[str]:
+        found = set()
+        for key, coordinate in (("top", py), ("bottom", py), ("left", px), ("right", px)):
+            for label, box in edges[key].get(round(coordinate), ()):
+                if box[0] - EPSILON <= px <= box[2] + EPSILON and box[1] - EPSILON <= py <= box[3] + EPSILON:
+                    found.add(label)
+        return found
+
+    return nodes_at
+
+
+def connector_endpoints(element: dict) -> tuple[tuple[float, float], tuple[float, float]]:
+    first, last = element["points"][0], element["points"][-1]
+    return (element["x"] + first[0], element["y"] + first[1]), (element["x"] + last[0], element["y"] + last[1])
+
+
+def match_edges(connectors: list[dict], expected: Counter, nodes_at, describe: str) -> list[str]:
+    """
+    Match each connector to one expected (source, target) edge it actually joins.
+
+    `expected` counts edges by (source label, target label); None on either
+    side means that end sits on a bundle bus rather than a node. A connector
+    drawn to the wrong node, and an edge left without a connector, are errors.
+    """
+    remaining = Counter(expected)
+    errors = []
+    for element in connectors:
+        start, end = connector_endpoints(element)
+        sources = nodes_at(*start) or {None}
+        targets = nodes_at(*end) or {None}
+        pair = next(((a, b) for a in sources for b in targets if remaining[(a, b)] > 0), None)
+        if pair is None:
+            errors.append(f"{element['type']} {element['id']} from {start} to {end} does not join "
+                          f"the nodes of any remaining {describe} edge")
+        else:
+            remaining[pair] -= 1
+    errors.extend(
+        f"{describe} edge {source} -> {target} has no {'' if count == 1 else f'{count} '}connector"
+        for (source, target), count in remaining.items() if count > 0
+    )
+    return errors
+
+
+def check_flowchart(nodes: list[dict], elements: list[dict]) -> list[str]:
+    labels = {node["label"] for node in nodes}
+    boxes, errors = node_boxes(elements, labels)
+    errors += check_bindings(elements)
+    errors += check_level_overlap(boxes)
+    arrows = [e for e in elements if e["type"] == "arrow"]
+    for element in arrows:
+        start, end = connector_endpoints(element)
+        # Straight arrows are forward edges and must point down; loops are routed around the side
+        if len(element["points"]) == 2 and end[1] <= start[1]:
+            errors.append(f"arrow {element['id']} points upward through the diagram")
+    label_of = {node["id"]: node["label"] for node in nodes}
+    expected = Counter(
+        (node["label"], label_of[target]) for node in nodes
+        for target in (node["next"].values() if isinstance(node.get("next"), dict) else [node.get("next")])
+        if target in label_of
+    )
+    errors += match_edges(arrows, expected, endpoint_locator(boxes), "flowchart")
+    return errors
+
+
+def check_architecture(components: list[dict], connections: list[dict], elements: list[dict],
+                       bundled: bool) -> list[str]:
+    labels = {comp["label"] for comp in components}
+    boxes, errors = node_boxes(elements, labels)
+    errors += check_bindings(elements)
+    errors += check_level_overlap(boxes)
+    label_of = {comp["id"]: comp["label"] for comp in components}
+
+    # Bundling decides which edges share a trunk; reuse it so each connector
+    # can be checked against the nodes of the edge it draws
+    if bundled:
+        layers = {comp["id"]: {"layer": comp.get("layer", 0)} for comp in components}
+        edges, bundles = bundle_connections(connections, layers)
+    else:
+        edges = [{"from": conn["from"], "to": conn["to"]} for conn in connections]
+        bundles = []
+    arrows = Counter((label_of[e["from"]], label_of[e["to"]]) for e in edges)
+    lines = Counter()
+    for bundle in bundles:
+        hub = label_of[bundle["hub"]]
+        if bundle["kind"] == "fan_out":
+            # Trunk line from the hub to the bus, then one arrow per member off the bus
+            lines[(hub, None)] += 1
+            arrows.update((None, label_of[e["to"]]) for e in bundle["members"])
+        else:
+            # One line per member onto the bus, then a single arrow down to the hub
+            lines.update((label_of[e["from"]], None) for e in bundle["members"])
+            arrows[(None, hub)] += 1
+
+    # Grouped lines are parts of library shapes, not connectors
+    connectors = [e for e in elements if e["type"] in ("arrow", "line") and not e.get("groupIds")]
+    nodes_at = endpoint_locator(boxes)
+    errors += match_edges([e for e in connectors if e["type"] == "arrow"], arrows, nodes_at, "connection")
+    errors += match_edges([e for e in connectors if e["type"] == "line"], lines, nodes_at, "bundle line")
+    return errors
+
+
+def measure(func, *args, repeats: int = 2, **kwargs) -> tuple[dict, float, float]:
+    """Best untraced wall time over `repeats` runs, plus peak memory of one traced run"""
+    elapsed_ms = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed_ms = min(elapsed_ms, (time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func(*args, **kwargs)
+    peak_mib = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return result, elapsed_ms, peak_mib
+
+
+def run_suite(name: str, ceilings: dict, seeds: range, case) -> bool:
+    """`case(rng, size)` returns (elapsed ms, peak MiB, errors) for one random input"""
+    ok = True
+    for size, (max_ms, max_mib) in ceilings.items():
+        worst_ms = worst_mib = 0.0
+        failures = []
+        for seed in seeds:
+            elapsed_ms, peak_mib, errors = case(random.Random(seed * 7919 + size), size)
+            worst_ms, worst_mib = max(worst_ms, elapsed_ms), max(worst_mib, peak_mib)
+            failures.extend(f"seed {seed}: {error}" for error in errors)
+        over = worst_ms > max_ms or worst_mib > max_mib
+        status = "ok" if not failures and not over else "FAIL"
+        print(f"{name:<26} n={size:<5} worst {worst_ms:8.1f} ms (max {max_ms})"
+              f"  {worst_mib:6.2f} MiB (max {max_mib})  {status}")
+        for failure in failures[:10]:
+            print(f"    {failure}")
+        if len(failures) > 10:
+            print(f"    ... {len(failures) - 10} more")
+        ok &= status == "ok"
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seeds", type=int, default=10)
+    parser.add_argument("--seed-offset", type=int, default=0)
+    args = parser.parse_args()
+    seeds = range(args.seed_offset, args.seed_offset + args.seeds)
+
+    def flowchart_case(rng, size):
+        nodes = random_flowchart(rng, size)
+        result, elapsed_ms, peak_mib = measure(create_advanced_flowchart, nodes)
+        return elapsed_ms, peak_mib, check_flowchart(nodes, result["elements"])
+
+    def architecture_case(bundled):
+        def case(rng, size):
+            components, connections = random_architecture(rng, size)
+            result, elapsed_ms, peak_mib = measure(
+                create_system_architecture, components, connections, bundleEdges=bundled
+            )
+            return elapsed_ms, peak_mib, check_architecture(components, connections, result["elements"], bundled)
+        return case
+
+    def looping_flowchart_case(rng, size):
+        nodes = random_looping_flowchart(rng, size)
+        result, elapsed_ms, peak_mib = measure(create_advanced_flowchart, nodes)
+        return elapsed_ms, peak_mib, check_flowchart(nodes, result["elements"])
+
+    ok = run_suite("advanced_flowchart", FLOWCHART_CEILINGS, seeds, flowchart_case)
+    ok &= run_suite("advanced_flowchart/loops", FLOWCHART_CEILINGS, seeds, looping_flowchart_case)
+    ok &= run_suite("system_architecture", ARCHITECTURE_CEILINGS, seeds, architecture_case(False))
+    ok &= run_suite("system_architecture/bundled", ARCHITECTURE_CEILINGS, seeds, architecture_case(True))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP (--api) and MCP SSE (--sse) transports.
+
+Starts server.py locally for each transport and replays a seeded mix of
+tool calls (mostly small primitives, plus heavy create_system_architecture
+and create_advanced_flowchart calls) from `concurrency` simulated chat users,
+each calling in a closed loop. Every (transport, concurrency) run gets the
+same workload and reports:
+
+  * throughput (successful calls per second)
+  * latency percentiles, overall and per light/heavy call class
+  * error rate (transport failures and tool errors)
+  * server RSS over time, sampled from /proc
+
+A comparison table is printed and the full report, with per-interval
+timelines, can be written as JSON so runs against different server
+configurations can be diffed. Exits non-zero if any run is over the
+error-rate budget.
+
+Usage:
+    python benchmarks/load_test.py [--transports api sse] [--concurrency 1 8 32]
+                                   [--duration 20] [--mix chat|heavy] [--seed 0]
+                                   [--report load_report.json]
+                                   [--external --port 8000 --server-pid PID]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections.abc import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layout_invariants import random_architecture, random_looping_flowchart  # noqa: E402
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(SERVER_DIR, "server.py")
+
+MAX_ERROR_RATE = 0.01
+STARTUP_TIMEOUT_S = 30
+REQUEST_TIMEOUT_S = 120
+
+# Packages each transport needs when the server is started locally
+TRANSPORT_REQUIREMENTS = {"api": ("fastapi", "uvicorn"), "sse": ("mcp",)}
+
+# mix -> call kind -> relative weight
+MIXES = {
+    "chat": {
+        "rectangle": 30, "ellipse": 10, "arrow": 20, "text": 10, "batch": 15,
+        "flowchart": 8, "architecture": 7,
+    },
+    "heavy": {
+        "rectangle": 10, "arrow": 10, "batch": 10,
+        "flowchart": 35, "architecture": 35,
+    },
+}
+HEAVY_KINDS = {"batch", "flowchart", "architecture"}
+
+
+def random_call(rng: random.Random, kind: str) -> tuple[str, dict]:
+    """Tool name and arguments for one call of the given kind, like a chat turn would send"""
+    x, y = rng.randint(0, 2000), rng.randint(0, 2000)
+    if kind == "rectangle":
+        return "create_rectangle", {"x": x, "y": y, "label": f"Box {rng.randint(1, 999)}"}
+    if kind == "ellipse":
+        return "create_ellipse", {"x": x, "y": y, "width": rng.randint(80, 300), "height": rng.randint(60, 200)}
+    if kind == "arrow":
+        return "create_arrow", {"startX": x, "startY": y, "endX": x + rng.randint(-400, 400),
+                                "endY": y + rng.randint(50, 400), "label": rng.choice([None, "calls", "reads"])}
+    if kind == "text":
+        return "create_text_standalone", {"x": x, "y": y, "text": f"Note {rng.randint(1, 999)}"}
+    if kind == "batch":
+        count = rng.randint(20, 200)
+        return "create_shapes_batch", {
+            "xs": [x + 220 * (i % 10) for i in range(count)],
+            "ys": [y + 120 * (i // 10) for i in range(count)],
+            "labels": [f"Item {i}" for i in range(count)],
+        }
+    if kind == "flowchart":
+        return "create_advanced_flowchart", {"nodes": random_looping_flowchart(rng, rng.randint(10, 120)), "x": x, "y": y}
+    components, connections = random_architecture(rng, rng.randint(8, 80))
+    return "create_system_architecture", {"components": components, "connections": connections, "x": x, "y": y}
+
+
+def workload(seed: int, user: int, mix: dict) -> Iterator[tuple[str, str, dict]]:
+    """Endless (kind, tool name, args) stream for one user; identical for every run with the same seed"""
+    rng = random.Random(seed * 100003 + user)
+    kinds, weights = list(mix), list(mix.values())
+    while True:
+        kind = rng.choices(kinds, weights)[0]
+        yield (kind, *random_call(rng, kind))
+
+
+class ApiClient:
+    """One chat user against `server.py --api`: a POST per tool call"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def call(self, tool_name: str, args: dict) -> None:
+        request = urllib.request.Request(
+            f"{self.base_url}/tools/{tool_name}",
+            data=json.dumps(args).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_S) as response:
+            result = json.loads(response.read())
+        if isinstance(result, dict) and "error" in result:
+            raise RuntimeError(result["error"])
+
+    def close(self) -> None:
+        pass
+
+
+class SseClient:
+    """
+    One chat user against `server.py --sse`: holds an MCP session open on
+    /sse, posts JSON-RPC messages to the session endpoint and reads each
+    response back from the event stream.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.stream = urllib.request.urlopen(f"{base_url}/sse", timeout=REQUEST_TIMEOUT_S)
+        self.endpoint = urllib.parse.urljoin(base_url, self._next_event("endpoint"))
+        self.ids = itertools.count(1)
+        self._request("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "load-test", "version": "1.0.0"},
+        })
+        self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    def _next_event(self, wanted: str) -> str:
+        event, data = "message", []
+        while True:
+            line = self.stream.readline()
+            if not line:
+                raise RuntimeError("SSE stream closed by server")
+            line = line.decode().rstrip("\r\n")
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            elif not line:
+                if data and event == wanted:
+                    return "\n".join(data)
+                event, data = "message", []
+
+    def _post(self, message: dict) -> None:
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(message).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_S).close()
+
+    def _request(self, method: str, params: dict) -> dict:
+        request_id = next(self.ids)
+        self._post({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+        while True:
+            message = json.loads(self._next_event("message"))
+            if message.get("id") != request_id:
+                continue
+            if "error" in message:
+                raise RuntimeError(message["error"].get("message", message["error"]))
+            return message["result"]
+
+    def call(self, tool_name: str, args: dict) -> None:
+        result = self._request("tools/call", {"name": tool_name, "arguments": args})
+        if result.get("isError"):
+            raise RuntimeError(result["content"][0].get("text", "tool error") if result.get("content") else "tool error")
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+CLIENTS = {"api": ApiClient, "sse": SseClient}
+
+
+def read_rss_mib(pid: int) -> float | None:
+    """Resident set size of a process in MiB, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_server(transport: str, port: int) -> subprocess.Popen:
+    """Spawn server.py for a transport and wait until it accepts connections"""
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_PATH, f"--{transport}", "--port", str(port)],
+        cwd=SERVER_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=log,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"server exited during startup:\n{log.read().decode(errors='replace')[-2000:]}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"server did not listen on port {port} within {STARTUP_TIMEOUT_S} s")
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "p50": round(percentile(latencies, 0.50), 1),
+        "p95": round(percentile(latencies, 0.95), 1),
+        "p99": round(percentile(latencies, 0.99), 1),
+        "max": round(latencies[-1], 1) if latencies else 0.0,
+    }
+
+
+def run_load(
+    transport: str,
+    base_url: str,
+    concurrency: int,
+    duration: float,
+    mix: dict,
+    seed: int,
+    server_pid: int | None,
+    sample_interval: float,
+) -> dict:
+    """Drive `concurrency` closed-loop users for `duration` seconds and summarize the run"""
+    # (finish time, latency ms, ok, kind) per call; list.append is atomic across threads
+    calls: list[tuple[float, float, bool, str]] = []
+    errors: list[str] = []
+    connect_failures: list[int] = []
+    rss_samples: list[tuple[float, float]] = []
+    stop = threading.Event()
+    start = time.perf_counter()
+
+    def user(index: int) -> None:
+        try:
+            client = CLIENTS[transport](base_url)
+        except (OSError, RuntimeError, ValueError) as e:
+            connect_failures.append(index)
+            errors.append(f"user {index} could not connect: {e}")
+            return
+        try:
+            for kind, tool_name, args in workload(seed, index, mix):
+                if stop.is_set():
+                    break
+                call_start = time.perf_counter()
+                try:
+                    client.call(tool_name, args)
+                    ok = True
+                except (OSError, RuntimeError, ValueError) as e:
+                    ok = False
+                    errors.append(f"{tool_name}: {e}")
+                now = time.perf_counter()
+                calls.append((now - start, (now - call_start) * 1000, ok, kind))
+        finally:
+            client.close()
+
+    def sample_rss() -> None:
+        while not stop.wait(sample_interval):
+            rss = read_rss_mib(server_pid)
+            if rss is not None:
+                rss_samples.append((time.perf_counter() - start, rss))
+
+    rss_start = read_rss_mib(server_pid) if server_pid else None
+    if rss_start is not None:
+        rss_samples.append((0.0, rss_start))
+    threads = [threading.Thread(target=user, args=(i,), daemon=True) for i in range(concurrency)]
+    if server_pid:
+        threads.append(threading.Thread(target=sample_rss, daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(REQUEST_TIMEOUT_S)
+    elapsed = time.perf_counter() - start
+
+    ok_latencies = [ms for _, ms, ok, _ in calls if ok]
+    failed = sum(1 for _, _, ok, _ in calls if not ok) + len(connect_failures)
+    attempts = len(calls) + len(connect_failures)
+
+    timeline = []
+    for step in range(int(elapsed / sample_interval) + 1):
+        low, high = step * sample_interval, (step + 1) * sample_interval
+        window = [(ms, ok) for t, ms, ok, _ in calls if low <= t < high]
+        rss = [mib for t, mib in rss_samples if t < high]
+        timeline.append({
+            "t": round(high, 2),
+            "throughput": round(sum(1 for _, ok in window if ok) / sample_interval, 1),
+            "p95_ms": latency_summary([ms for ms, ok in window if ok])["p95"],
+            "errors": sum(1 for _, ok in window if not ok),
+            "rss_mib": round(rss[-1], 1) if rss else None,
+        })
+
+    rss_values = [mib for _, mib in rss_samples]
+    return {
+        "transport": transport,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "calls": attempts,
+        "errors": failed,
+        "error_rate": round(failed / attempts, 4) if attempts else 1.0,
+        "throughput": round(len(ok_latencies) / elapsed, 1),
+        "latency_ms": latency_summary(ok_latencies),
+        "latency_ms_by_class": {
+            name: latency_summary([ms for _, ms, ok, kind in calls if ok and (kind in HEAVY_KINDS) == heavy])
+            for name, heavy in (("light", False), ("heavy", True))
+        },
+        "rss_mib": {
+            "start": round(rss_start, 1) if rss_start is not None else None,
+            "peak": round(max(rss_values), 1) if rss_values else None,
+            "end": round(rss_values[-1], 1) if rss_values else None,
+        },
+        "sample_errors": errors[:10],
+        "timeline": timeline,
+    }
+
+
+def print_report(runs: list[dict]) -> None:
+    print(f"{'transport':<10}{'users':>6}{'calls':>8}{'rps':>8}{'err %':>7}"
+          f"{'p50':>8}{'p95':>8}{'p99':>8}{'heavy p95':>11}{'rss start':>11}{'rss peak':>10}")
+    for run in runs:
+        rss = run["rss_mib"]
+        latency = run["latency_ms"]
+        print(f"{run['transport']:<10}{run['concurrency']:>6}{run['calls']:>8}{run['throughput']:>8.1f}"
+              f"{run['error_rate'] * 100:>7.2f}{latency['p50']:>8.1f}{latency['p95']:>8.1f}{latency['p99']:>8.1f}"
+              f"{run['latency_ms_by_class']['heavy']['p95']:>11.1f}"
+              f"{rss['start'] if rss['start'] is not None else '-':>11}"
+              f"{rss['peak'] if rss['peak'] is not None else '-':>10}")
+        for error in run["sample_errors"][:3]:
+            print(f"    {error}")
+
+
+def _importable(name: str) -> bool:
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transports", nargs="+", choices=sorted(CLIENTS), default=["api", "sse"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per run")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="chat")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds per timeline point")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE)
+    parser.add_argument("--external", action="store_true",
+                        help="load an already running server on --port instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="pid to sample RSS from with --external")
+    parser.add_argument("--report", help="write the full report, with timelines, to this JSON file")
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    runs = []
+    for transport in args.transports:
+        if not args.external:
+            missing = [name for name in TRANSPORT_REQUIREMENTS[transport] if not _importable(name)]
+            if missing:
+                print(f"{transport}: skipped ({', '.join(missing)} not installed)")
+                continue
+        for concurrency in args.concurrency:
+            # A fresh server per run, so RSS and warm caches don't carry over between runs
+            proc = None if args.external else start_server(transport, args.port)
+            try:
+                pid = args.server_pid if args.external else proc.pid
+                runs.append(run_load(
+                    transport, base_url, concurrency, args.duration, MIXES[args.mix],
+                    args.seed, pid, args.sample_interval,
+                ))
+            finally:
+                if proc is not None:
+                    proc.terminate()
+                    try:
+                        proc.wait(10)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                        proc.wait()
+
+    print_report(runs)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"mix": args.mix, "seed": args.seed, "runs": runs}, f, indent=2)
+        print(f"report written to {args.report}")
+
+    over = [run for run in runs if run["error_rate"] > args.max_error_rate]
+    for run in over:
+        print(f"FAIL: {run['transport']} at {run['concurrency']} users: "
+              f"error rate {run['error_rate']:.2%} (max {args.max_error_rate:.2%})")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Batch shape-creation benchmark.
+
+Lays out a grid of labelled shapes with a handful of distinct styles and
+times create_shapes_batch() against the equivalent loop of create_rectangle()
+calls. Exits non-zero if the batch call is over its time budget or is not at
+least MIN_SPEEDUP times faster than the loop.
+
+Usage:
+    python benchmarks/shapes_batch.py [--shapes 50000] [--runs 3] [--budget-ms 900] [--min-speedup 1.8]
+"""
+
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import create_rectangle, create_shapes_batch  # noqa: E402
+
+BUDGET_MS = 900
+MIN_SPEEDUP = 1.8
+
+STYLES = [
+    {"strokeColor": "#8b5cf6", "backgroundColor": "transparent"},
+    {"strokeColor": "#a78bfa", "backgroundColor": "#ede9fe", "fillStyle": "hachure"},
+    {"strokeColor": "#c4b5fd", "strokeWidth": 1, "strokeStyle": "dashed"},
+]
+
+
+def generate_grid(shape_count: int) -> dict:
+    """Column arrays for a 250-wide grid of 160x60 labelled shapes"""
+    return {
+        "xs": [(i % 250) * 220 for i in range(shape_count)],
+        "ys": [(i // 250) * 120 for i in range(shape_count)],
+        "widths": [160],
+        "heights": [60],
+        "labels": [f"Item {i}" for i in range(shape_count)],
+        "styles": [STYLES[i % len(STYLES)] for i in range(shape_count)],
+    }
+
+
+def build_with_loop(columns: dict) -> list[dict]:
+    elements = []
+    for i, (x, y) in enumerate(zip(columns["xs"], columns["ys"])):
+        style = columns["styles"][i]
+        result = create_rectangle(
+            x, y, 160, 60,
+            strokeColor=style.get("strokeColor", "#8b5cf6"),
+            backgroundColor=style.get("backgroundColor", "transparent"),
+            strokeWidth=style.get("strokeWidth", 2),
+            strokeStyle=style.get("strokeStyle", "solid"),
+            fillStyle=style.get("fillStyle", "solid"),
+            label=columns["labels"][i]
+        )
+        elements.extend(result["elements"])
+    return elements
+
+
+def measure(build, runs: int) -> tuple[float, int]:
+    samples = []
+    count = 0
+    for _ in range(runs):
+        # Collect the previous run's elements outside the timed region
+        gc.collect()
+        start = time.perf_counter()
+        elements = build()
+        samples.append((time.perf_counter() - start) * 1000)
+        count = len(elements)
+        del elements
+    return statistics.median(samples), count
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shapes", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--min-speedup", type=float, default=MIN_SPEEDUP)
+    args = parser.parse_args()
+
+    columns = generate_grid(args.shapes)
+    batch_ms, batch_count = measure(lambda: create_shapes_batch(**columns)["elements"], args.runs)
+    loop_ms, loop_count = measure(lambda: build_with_loop(columns), args.runs)
+    speedup = loop_ms / batch_ms
+
+    print(f"{args.shapes} labelled shapes, {len(STYLES)} styles")
+    print(f"loop:  {loop_ms:8.1f} ms  {loop_count:6d} elements")
+    print(f"batch: {batch_ms:8.1f} ms  {batch_count:6d} elements  (budget {args.budget_ms:.0f} ms)")
+    print(f"speedup: {speedup:.1f}x  (minimum {args.min_speedup:.1f}x)")
+
+    failed = False
+    if batch_ms > args.budget_ms:
+        print("FAIL: batch over budget")
+        failed = True
+    if batch_count != loop_count:
+        print("FAIL: batch and loop produced different element counts")
+        failed = True
+    if speedup < args.min_speedup:
+        print("FAIL: batch not faster than the loop by the required margin")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the Constellar MCP server.
+
+Claude Desktop spawns server.py once per session over stdio, so process
+startup sits on the user-visible path. This script measures:
+
+  * import cost of server.py from cached bytecode, via `python -X importtime`
+  * time from process spawn to the first tools/call response over stdio
+
+and exits non-zero when either exceeds its budget.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--import-budget-ms 40]
+                                 [--first-response-budget-ms 1500]
+"""
+
+import argparse
+import json
+import os
+import py_compile
+import statistics
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PATH = os.path.join(SERVER_DIR, "server.py")
+
+# About twice the measured cost (~20 ms), so noise doesn't trip it but a heavy new import does
+IMPORT_BUDGET_MS = 40
+FIRST_RESPONSE_BUDGET_MS = 1500
+
+
+def measure_import(runs: int) -> tuple[float, list[tuple[int, str]]]:
+    """Return median cumulative import time of `server` (ms) and the heaviest imports"""
+    # Measure importing cached bytecode, as an installed server does, rather than
+    # compiling the source each run (e.g. a fresh checkout or PYTHONDONTWRITEBYTECODE)
+    py_compile.compile(SERVER_PATH, doraise=True)
+    samples = []
+    heaviest: list[tuple[int, str]] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import server"],
+            cwd=SERVER_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((int(cumulative_us), name.rstrip()))
+        samples.append(next(cum for cum, name in rows if name == " server") / 1000)
+        # Only top-level imports; nested ones are already counted in their parent
+        heaviest = sorted(
+            ((cum, name.strip()) for cum, name in rows if not name.startswith("  ")),
+            reverse=True,
+        )[:10]
+    return statistics.median(samples), heaviest
+
+
+def _send(proc: subprocess.Popen, message: dict) -> None:
+    proc.stdin.write(json.dumps(message) + "\n")
+    proc.stdin.flush()
+
+
+def _read_response(proc: subprocess.Popen, request_id: int) -> dict:
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("server exited before responding")
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+
+
+def measure_first_response() -> float:
+    """Spawn the stdio server and time initialize + one tools/call round trip (ms)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_PATH],
+        cwd=SERVER_DIR,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        _send(proc, {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "initialize",
+            "params": {
+                "protocolVersion": "2024-11-05",
+                "capabilities": {},
+                "clientInfo": {"name": "startup-benchmark", "version": "1.0.0"},
+            },
+        })
+        _read_response(proc, 1)
+        _send(proc, {"jsonrpc": "2.0", "method": "notifications/initialized"})
+        _send(proc, {
+            "jsonrpc": "2.0",
+            "id": 2,
+            "method": "tools/call",
+            "params": {"name": "create_rectangle", "arguments": {"x": 0, "y": 0, "label": "Hello"}},
+        })
+        response = _read_response(proc, 2)
+        elapsed = (time.perf_counter() - start) * 1000
+        if "error" in response:
+            raise RuntimeError(f"tools/call failed: {response['error']}")
+        return elapsed
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--first-response-budget-ms", type=float, default=FIRST_RESPONSE_BUDGET_MS)
+    args = parser.parse_args()
+
+    failed = False
+
+    import_ms, heaviest = measure_import(args.runs)
+    status = "ok" if import_ms <= args.import_budget_ms else "OVER BUDGET"
+    failed |= import_ms > args.import_budget_ms
+    print(f"import server:        {import_ms:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)  {status}")
+    for cumulative_us, name in heaviest:
+        print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+
+    try:
+        import mcp  # noqa: F401
+    except ImportError:
+        print("first tool response:  skipped (mcp package not installed)")
+    else:
+        samples = [measure_first_response() for _ in range(args.runs)]
+        first_ms = statistics.median(samples)
+        status = "ok" if first_ms <= args.first_response_budget_ms else "OVER BUDGET"
+        failed |= first_ms > args.first_response_budget_ms
+        print(f"first tool response:  {first_ms:8.1f} ms  (budget {args.first_response_budget_ms:.0f} ms)  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
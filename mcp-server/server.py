@@ -4,19 +4,62 @@ Constellar MCP Server - Excalidraw Canvas Tools
 Provides tools for generating Excalidraw elements through Claude MCP
 """
 
-import json
+import os
 import random
-import string
-from typing import Literal, Optional
-from mcp.server.fastmcp import FastMCP
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Callable, Literal, Optional
 
-# Initialize FastMCP server
-mcp = FastMCP("Constellar Canvas")
+# Tool registry. Tools are collected here at import time and only handed to
+# FastMCP once a transport actually needs them, so importing this module (and
+# starting the --api server) never pays for the MCP stack.
+TOOLS: dict[str, Callable[..., dict]] = {}
+
+_mcp = None
+_shape_library = None
+_ID_SYMBOLS = bytes.maketrans(b"+/", b"Zz")
+# string.ascii_letters + string.digits, spelled out: importing `string` pulls in `re`
+_ID_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+def tool(func: Callable[..., dict]) -> Callable[..., dict]:
+    """Register a function as a canvas tool"""
+    TOOLS[func.__name__] = func
+    return func
+
+
+def get_mcp():
+    """Build the FastMCP server on first use and register all tools with it"""
+    global _mcp
+    if _mcp is None:
+        from mcp.server.fastmcp import FastMCP
+
+        _mcp = FastMCP("Constellar Canvas")
+        for func in TOOLS.values():
+            _mcp.add_tool(func)
+    return _mcp
+
+
+def __getattr__(name: str):
+    # Keep `server.mcp` working for code that imported the old module global
+    if name == "mcp":
+        return get_mcp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate_id(length: int = 12) -> str:
     """Generate a random ID for Excalidraw elements"""
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+    return ''.join(random.choices(_ID_ALPHABET, k=length))
+
+
+def generate_ids(count: int) -> list[str]:
+    """Generate `count` random 12-character element IDs in one pass"""
+    # 9 random bytes encode to exactly 12 base64 characters; map the two
+    # symbols onto letters to keep IDs alphanumeric like generate_id()
+    import base64
+
+    chars = base64.b64encode(random.randbytes(count * 9)).translate(_ID_SYMBOLS).decode()
+    return [chars[i:i + 12] for i in range(0, count * 12, 12)]
 
 
 def create_base_element(
@@ -58,7 +101,7 @@ def create_base_element(
     return element
 
 
-@mcp.tool()
+@tool
 def create_rectangle(
     x: float,
     y: float,
@@ -119,7 +162,7 @@ def create_rectangle(
     return {"elements": elements}
 
 
-@mcp.tool()
+@tool
 def create_ellipse(
     x: float,
     y: float,
@@ -179,7 +222,7 @@ def create_ellipse(
     return {"elements": elements}
 
 
-@mcp.tool()
+@tool
 def create_diamond(
     x: float,
     y: float,
@@ -239,7 +282,7 @@ def create_diamond(
     return {"elements": elements}
 
 
-@mcp.tool()
+@tool
 def create_arrow(
     startX: float,
     startY: float,
@@ -275,8 +318,8 @@ def create_arrow(
 
     element = create_base_element(
         "arrow",
-        min(startX, endX),
-        min(startY, endY),
+        startX,
+        startY,
         width,
         height,
         strokeColor=strokeColor,
@@ -284,7 +327,7 @@ def create_arrow(
         strokeStyle=strokeStyle
     )
 
-    # Calculate points relative to element position
+    # Points are relative to the element position, which is the start point
     points = [
         [0, 0],
         [endX - startX, endY - startY]
@@ -320,7 +363,7 @@ def create_arrow(
     return {"elements": elements}
 
 
-@mcp.tool()
+@tool
 def create_line(
     startX: float,
     startY: float,
@@ -350,8 +393,8 @@ def create_line(
 
     element = create_base_element(
         "line",
-        min(startX, endX),
-        min(startY, endY),
+        startX,
+        startY,
         width,
         height,
         strokeColor=strokeColor,
@@ -359,7 +402,7 @@ def create_line(
         strokeStyle=strokeStyle
     )
 
-    # Calculate points relative to element position
+    # Points are relative to the element position, which is the start point
     points = [
         [0, 0],
         [endX - startX, endY - startY]
@@ -377,6 +420,52 @@ def create_line(
     return {"elements": [element]}
 
 
+def create_polyline(
+    element_type: Literal["arrow", "line"],
+    points: list[tuple[float, float]],
+    strokeColor: str = "#8b5cf6",
+    strokeWidth: int = 2,
+    strokeStyle: Literal["solid", "dashed", "dotted"] = "solid",
+    endArrowhead: Optional[Literal["arrow", "bar", "dot", "triangle"]] = None
+) -> dict:
+    """Create a multi-point arrow or line element from absolute canvas points"""
+    # Drop repeated points so degenerate segments don't end up in the element
+    points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+    origin_x, origin_y = points[0]
+    xs = [px for px, _ in points]
+    ys = [py for _, py in points]
+
+    element = create_base_element(
+        element_type,
+        origin_x,
+        origin_y,
+        max(xs) - min(xs),
+        max(ys) - min(ys),
+        strokeColor=strokeColor,
+        strokeWidth=strokeWidth,
+        strokeStyle=strokeStyle
+    )
+
+    element.update({
+        "points": [[px - origin_x, py - origin_y] for px, py in points],
+        "lastCommittedPoint": None,
+        "startBinding": None,
+        "endBinding": None,
+        "startArrowhead": None,
+        "endArrowhead": endArrowhead
+    })
+
+    return element
+
+
+def measure_text(text: str, fontSize: int = 20) -> tuple[float, float]:
+    """Approximate rendered (width, height) of a text block"""
+    lines = text.split('\n')
+    width = max(len(line) for line in lines) * fontSize * 0.6
+    height = len(lines) * fontSize * 1.4
+    return width, height
+
+
 def create_text(
     x: float,
     y: float,
@@ -389,12 +478,7 @@ def create_text(
     containerId: Optional[str] = None
 ) -> dict:
     """Create a text element (used internally and as standalone)"""
-    # Calculate approximate text dimensions
-    char_width = fontSize * 0.6
-    line_height = fontSize * 1.4
-    lines = text.split('\n')
-    width = max(len(line) * char_width for line in lines)
-    height = len(lines) * line_height
+    width, height = measure_text(text, fontSize)
 
     element = create_base_element(
         "text",
@@ -420,7 +504,7 @@ def create_text(
     return element
 
 
-@mcp.tool()
+@tool
 def create_text_standalone(
     x: float,
     y: float,
@@ -455,7 +539,383 @@ def create_text_standalone(
     return {"elements": [element]}
 
 
-@mcp.tool()
+def broadcast_column(values: Optional[list], count: int, default, name: str) -> list:
+    """Expand an optional batch column to `count` entries; a single value applies to every row"""
+    if values is None:
+        return [default] * count
+    if len(values) == 1:
+        return list(values) * count
+    if len(values) != count:
+        raise ValueError(f"{name} must have 1 or {count} entries, got {len(values)}")
+    return list(values)
+
+
+# Style fields create_shapes_batch understands; anything else in a style dict is ignored
+BATCH_STYLE_FIELDS = ("strokeColor", "backgroundColor", "strokeWidth", "strokeStyle", "fillStyle")
+
+
+def batch_style_key(style: dict) -> tuple:
+    """Hashable key of the documented style fields (None where unset), validating their values"""
+    if not isinstance(style, dict):
+        raise ValueError(f"Style must be an object, got {type(style).__name__}")
+    key = tuple(style.get(field) for field in BATCH_STYLE_FIELDS)
+    for field, value in zip(BATCH_STYLE_FIELDS, key):
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError(f"Style field {field} must be a string or number, got {type(value).__name__}")
+    return key
+
+
+@tool
+def create_shapes_batch(
+    xs: list[float],
+    ys: list[float],
+    widths: Optional[list[float]] = None,
+    heights: Optional[list[float]] = None,
+    labels: Optional[list[Optional[str]]] = None,
+    styles: Optional[list[dict]] = None,
+    shapeTypes: Optional[list[Literal["rectangle", "ellipse", "diamond"]]] = None,
+    fontSize: int = 20
+) -> dict:
+    """
+    Create many rectangles, ellipses or diamonds in one call from column arrays.
+
+    Use this instead of repeated create_rectangle/create_ellipse/create_diamond
+    calls for grids, timelines or scatter-style layouts. Every column other than
+    xs and ys is optional and may hold a single value that applies to all shapes.
+
+    Args:
+        xs: X coordinates of each shape's top-left corner
+        ys: Y coordinates of each shape's top-left corner
+        widths: Shape widths (default 200)
+        heights: Shape heights (default 100)
+        labels: Optional text label per shape (null or empty for none)
+        styles: Style dict per shape with any of strokeColor, backgroundColor,
+                strokeWidth, strokeStyle, fillStyle (default purple outline);
+                other keys are ignored
+        shapeTypes: rectangle, ellipse or diamond per shape (default rectangle)
+        fontSize: Font size for labels (default 20)
+
+    Returns:
+        Excalidraw elements for all shapes, each followed by its label if it has one
+    """
+    count = len(xs)
+    if len(ys) != count:
+        raise ValueError(f"ys must have {count} entries, got {len(ys)}")
+
+    widths = broadcast_column(widths, count, 200, "widths")
+    heights = broadcast_column(heights, count, 100, "heights")
+    labels = broadcast_column(labels, count, None, "labels")
+    styles = broadcast_column(styles, count, None, "styles")
+    shape_types = broadcast_column(shapeTypes, count, "rectangle", "shapeTypes")
+
+    # Text metrics mirror create_text: longest line drives width, line count drives height
+    labelled = [i for i, label in enumerate(labels) if label]
+    label_lines = [labels[i].split('\n') for i in labelled]
+    text_widths = [max(len(line) for line in lines) * fontSize * 0.6 for lines in label_lines]
+    text_heights = [len(lines) * fontSize * 1.4 for lines in label_lines]
+
+    ids = generate_ids(count + len(labelled))
+    randbits = random.getrandbits
+    seeds = [randbits(31) or 1 for _ in range(2 * (count + len(labelled)))]
+
+    # One template per distinct (shape type, style); rows only fill in what varies
+    templates = {}
+    text_template = create_base_element("text", 0, 0, 0, 0, strokeColor="#000000")
+    text_template.update({
+        "fontSize": fontSize,
+        "fontFamily": 1,
+        "textAlign": "center",
+        "verticalAlign": "middle",
+        "baseline": fontSize,
+        "lineHeight": 1.25,
+        "text": "",
+        "originalText": "",
+        "containerId": None
+    })
+
+    elements = []
+    label_index = {row: k for k, row in enumerate(labelled)}
+    # Style dicts stay alive in `styles`, so id() is a safe memo key here
+    style_keys = {}
+    no_style = {}
+    n = 0
+    for i in range(count):
+        shape_type = shape_types[i]
+        style = styles[i] or no_style
+        style_key = style_keys.get(id(style))
+        if style_key is None:
+            style_key = style_keys[id(style)] = batch_style_key(style)
+        key = (shape_type, style_key)
+        template = templates.get(key)
+        if template is None:
+            if shape_type not in ("rectangle", "ellipse", "diamond"):
+                raise ValueError(f"Unsupported shape type: {shape_type}")
+            template = create_base_element(
+                shape_type, 0, 0, 0, 0,
+                strokeColor=style.get("strokeColor", "#8b5cf6"),
+                backgroundColor=style.get("backgroundColor", "transparent"),
+                strokeWidth=style.get("strokeWidth", 2),
+                strokeStyle=style.get("strokeStyle", "solid"),
+                fillStyle=style.get("fillStyle", "solid")
+            )
+            templates[key] = template
+
+        # Copy-and-assign is the cheapest way to stamp out a dict in CPython
+        element = template.copy()
+        element["id"] = ids[n]
+        element["x"] = xs[i]
+        element["y"] = ys[i]
+        element["width"] = widths[i]
+        element["height"] = heights[i]
+        element["groupIds"] = []
+        element["roundness"] = {"type": 3} if shape_type == "rectangle" else None
+        element["seed"] = seeds[2 * n]
+        element["versionNonce"] = seeds[2 * n + 1]
+        elements.append(element)
+        n += 1
+
+        k = label_index.get(i)
+        if k is not None:
+            text_element = text_template.copy()
+            text_element["id"] = ids[n]
+            text_element["x"] = xs[i] + widths[i] / 2 - text_widths[k] / 2
+            text_element["y"] = ys[i] + heights[i] / 2 - text_heights[k] / 2
+            text_element["width"] = text_widths[k]
+            text_element["height"] = text_heights[k]
+            text_element["groupIds"] = []
+            text_element["seed"] = seeds[2 * n]
+            text_element["versionNonce"] = seeds[2 * n + 1]
+            text_element["text"] = text_element["originalText"] = labels[i]
+            text_element["containerId"] = element["id"]
+            element["boundElements"] = [{"type": "text", "id": ids[n]}]
+            elements.append(text_element)
+            n += 1
+
+    return {"elements": elements}
+
+
+# Built-in component templates; teams can add or override shapes by listing
+# extra JSON files or directories in CONSTELLAR_SHAPES (os.pathsep separated)
+SHAPE_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shapes.json")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_shape(shape) -> None:
+    """Check one shape definition against the library schema, raising ValueError on the first problem"""
+    if not isinstance(shape, dict):
+        raise ValueError("shape must be an object")
+    style = shape.get("style")
+    if not isinstance(style, dict) or not all(
+        isinstance(style.get(key), str) for key in ("strokeColor", "backgroundColor")
+    ):
+        raise ValueError("'style' must set strokeColor and backgroundColor strings")
+    if not isinstance(shape.get("description", ""), str):
+        raise ValueError("'description' must be a string")
+
+    parts = shape.get("parts")
+    if not isinstance(parts, list) or not parts:
+        raise ValueError("'parts' must be a non-empty list")
+    for index, part in enumerate(parts):
+        where = f"part {index}"
+        if not isinstance(part, dict):
+            raise ValueError(f"{where} must be an object")
+        part_type = part.get("type")
+        if part_type == "line":
+            points = part.get("points")
+            if not isinstance(points, list) or len(points) < 2 or not all(
+                isinstance(point, list) and len(point) == 2 and all(map(_is_number, point)) for point in points
+            ):
+                raise ValueError(f"{where}: line needs 'points' with at least two [x, y] pairs")
+        elif part_type in ("rectangle", "ellipse", "diamond"):
+            box = part.get("box")
+            if not isinstance(box, list) or len(box) != 4 or not all(map(_is_number, box)) \
+                    or box[0] >= box[2] or box[1] >= box[3]:
+                raise ValueError(f"{where}: {part_type} needs 'box' [x1, y1, x2, y2] with x1 < x2 and y1 < y2")
+        else:
+            raise ValueError(f"{where}: unknown type {part_type!r} (expected rectangle, ellipse, diamond or line)")
+        for key in ("stroke", "fill"):
+            if not isinstance(part.get(key, "style"), str):
+                raise ValueError(f"{where}: '{key}' must be \"style\", \"none\" or a color string")
+        if not _is_number(part.get("strokeWidth", 2)):
+            raise ValueError(f"{where}: 'strokeWidth' must be a number")
+        if not isinstance(part.get("rounded", False), bool):
+            raise ValueError(f"{where}: 'rounded' must be true or false")
+
+    label = shape.get("label", 0)
+    if not isinstance(label, int) or isinstance(label, bool) or not 0 <= label < len(parts):
+        raise ValueError(f"'label' must be a part index between 0 and {len(parts) - 1}")
+    # Excalidraw only contains text in boxes, so the label cannot sit on a line part
+    if parts[label]["type"] == "line":
+        raise ValueError(f"'label' points at part {label}, a line; it must be a rectangle, ellipse or diamond")
+
+
+def get_shape_library() -> dict[str, dict]:
+    """
+    Load the shape library once per process and return it by shape name.
+
+    Each shape has a 'style' (default strokeColor/backgroundColor), a list of
+    'parts' in unit coordinates (0-1 across the component's box) and the
+    index of the box part that holds the 'label'. Parts are rectangle, ellipse or
+    diamond with a 'box' [x1, y1, x2, y2], or line with 'points'; 'stroke' and
+    'fill' may be "style" (follow the shape's colors), "none" or a color.
+    Parts together should span the whole unit box, since connectors attach
+    to its edges.
+
+    Every shape is validated here, so a bad definition fails with a ValueError
+    naming its file and shape instead of a KeyError deep inside a diagram.
+    CONSTELLAR_SHAPES entries that do not exist are skipped with a warning.
+    """
+    global _shape_library
+    if _shape_library is None:
+        import json
+        import warnings
+
+        paths = [SHAPE_LIBRARY_PATH]
+        for entry in os.environ.get("CONSTELLAR_SHAPES", "").split(os.pathsep):
+            if not entry:
+                continue
+            if os.path.isdir(entry):
+                paths.extend(sorted(
+                    os.path.join(entry, name) for name in os.listdir(entry) if name.endswith(".json")
+                ))
+            elif os.path.exists(entry):
+                paths.append(entry)
+            else:
+                warnings.warn(f"CONSTELLAR_SHAPES entry {entry} does not exist; skipping it")
+
+        library = {}
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"Cannot load shape library {path}: {e}") from e
+            shapes = data.get("shapes", {}) if isinstance(data, dict) else None
+            if not isinstance(shapes, dict):
+                raise ValueError(f"Shape library {path} must be an object with a 'shapes' mapping")
+            for name, shape in shapes.items():
+                try:
+                    validate_shape(shape)
+                except ValueError as e:
+                    raise ValueError(f"Shape {name!r} in {path}: {e}") from None
+            library.update(shapes)
+        _shape_library = library
+    return _shape_library
+
+
+@lru_cache(maxsize=256)
+def compile_shape(name: str, width: float, height: float) -> tuple[tuple[dict, bool, bool], ...]:
+    """
+    Build a shape's elements at the origin for one size.
+
+    Returns (element, follows_stroke, follows_fill) per part; the flags mark
+    colors that come from the shape style and may be overridden per instance.
+    The elements are shared templates and must be copied, never mutated.
+    """
+    shape = get_shape_library()[name]
+    compiled = []
+    for part in shape["parts"]:
+        is_line = part["type"] == "line"
+        stroke = part.get("stroke", "style")
+        fill = part.get("fill", "none" if is_line else "style")
+        colors = {
+            "strokeColor": shape["style"]["strokeColor"] if stroke == "style" else stroke,
+            "backgroundColor": shape["style"]["backgroundColor"] if fill == "style" else fill
+        }
+        for key, value in colors.items():
+            if value == "none":
+                colors[key] = "transparent"
+
+        if is_line:
+            element = create_polyline(
+                "line",
+                [(px * width, py * height) for px, py in part["points"]],
+                strokeColor=colors["strokeColor"],
+                strokeWidth=part.get("strokeWidth", 2)
+            )
+            element["backgroundColor"] = colors["backgroundColor"]
+        else:
+            x1, y1, x2, y2 = part["box"]
+            element = create_base_element(
+                part["type"],
+                x1 * width, y1 * height, (x2 - x1) * width, (y2 - y1) * height,
+                strokeWidth=part.get("strokeWidth", 2),
+                roundness={"type": 3} if part.get("rounded") else None,
+                **colors
+            )
+        compiled.append((element, stroke == "style", fill == "style"))
+    return tuple(compiled)
+
+
+def instantiate_shape(
+    name: str,
+    x: float,
+    y: float,
+    width: float,
+    height: float,
+    label: Optional[str] = None,
+    strokeColor: Optional[str] = None,
+    backgroundColor: Optional[str] = None
+) -> dict:
+    """Place a library shape by translating its compiled template; all parts share one group"""
+    shape = get_shape_library()[name]
+    compiled = compile_shape(name, width, height)
+    group_id = generate_id()
+    ids = generate_ids(len(compiled))
+
+    elements = []
+    for (template, follows_stroke, follows_fill), element_id in zip(compiled, ids):
+        element = dict(template)
+        element.update({
+            "id": element_id,
+            "x": template["x"] + x,
+            "y": template["y"] + y,
+            "groupIds": [group_id],
+            "seed": random.randint(1, 2147483647),
+            "versionNonce": random.randint(1, 2147483647)
+        })
+        if "points" in template:
+            element["points"] = [list(point) for point in template["points"]]
+        if strokeColor and follows_stroke:
+            element["strokeColor"] = strokeColor
+        if backgroundColor and follows_fill:
+            element["backgroundColor"] = backgroundColor
+        elements.append(element)
+
+    if label:
+        container = elements[shape["label"]]
+        text_element = create_text(
+            container["x"] + container["width"] / 2,
+            container["y"] + container["height"] / 2,
+            label,
+            fontSize=20,
+            textAlign="center",
+            verticalAlign="middle",
+            containerId=container["id"]
+        )
+        text_element["groupIds"] = [group_id]
+        container["boundElements"] = [{"type": "text", "id": text_element["id"]}]
+        elements.append(text_element)
+
+    return {"elements": elements}
+
+
+@tool
+def list_shape_library() -> dict:
+    """
+    List the component shapes available to create_system_architecture (component 'type'
+    or 'shape') and create_advanced_flowchart (node 'shape').
+
+    Returns:
+        Mapping of shape name to its description
+    """
+    return {"shapes": {name: shape.get("description", "") for name, shape in get_shape_library().items()}}
+
+
+@tool
 def create_flowchart(
     title: str,
     steps: list[str],
@@ -523,7 +983,397 @@ def create_flowchart(
     return {"elements": elements}
 
 
-@mcp.tool()
+# Candidate label positions, in order of preference: fraction along the edge,
+# then which side of the edge (0 = centered on it, +1/-1 = offset either side)
+LABEL_CANDIDATES = [(t, side) for t in (0.5, 0.35, 0.65, 0.2, 0.8) for side in (0, 1, -1)]
+
+# Score at which a candidate counts as fully blocked (one label-sized overlap)
+LABEL_COST_CAP = 10
+
+# Edges clipped against one candidate before it stops looking at more edges, so
+# labels where hundreds of edges converge still cost a bounded amount
+LABEL_SEGMENT_CHECKS = 12
+
+
+def _grid_cells(x1: float, y1: float, x2: float, y2: float, cellSize: float):
+    """Yield the grid cells covered by a bounding box"""
+    for gx in range(int(x1 // cellSize), int(x2 // cellSize) + 1):
+        for gy in range(int(y1 // cellSize), int(y2 // cellSize) + 1):
+            yield gx, gy
+
+
+def _segment_spans(x1: float, y1: float, x2: float, y2: float, cellSize: float):
+    """
+    Walk the grid rows a segment crosses (columns, if it is steep) and yield
+    (steep, line, first, last) for the run of cells it covers in each.
+
+    Covers the same cells as a cell-by-cell DDA walk, but takes one step per
+    row, so long shallow edges and buses cost a handful of steps.
+    """
+    steep = abs(y2 - y1) > abs(x2 - x1)
+    if steep:
+        x1, y1, x2, y2 = y1, x1, y2, x2
+    dx, dy = x2 - x1, y2 - y1
+    first_row, last_row = sorted((int(y1 // cellSize), int(y2 // cellSize)))
+    for row in range(first_row, last_row + 1):
+        if dy:
+            # Where the segment enters and leaves this row's band, clamped to its ends
+            t_a = min(1.0, max(0.0, (row * cellSize - y1) / dy))
+            t_b = min(1.0, max(0.0, ((row + 1) * cellSize - y1) / dy))
+            xa, xb = x1 + dx * t_a, x1 + dx * t_b
+        else:
+            xa, xb = x1, x2
+        yield steep, row, int(min(xa, xb) // cellSize), int(max(xa, xb) // cellSize)
+
+
+def _overlap_area(a: tuple, b: tuple) -> float:
+    """Intersection area of two (x1, y1, x2, y2) boxes"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return width * height if width > 0 and height > 0 else 0
+
+
+def _segment_crosses_box(segment: tuple, box: tuple) -> bool:
+    """Whether a segment passes through a box (Liang-Barsky clipping); callers reject by bounding box first"""
+    x1, y1, x2, y2 = segment
+    dx, dy = x2 - x1, y2 - y1
+    t0, t1 = 0.0, 1.0
+    # Clip the segment's parameter range against each pair of box edges in turn
+    if dx:
+        ta, tb = (box[0] - x1) / dx, (box[2] - x1) / dx
+        if ta > tb:
+            ta, tb = tb, ta
+        t0, t1 = max(t0, ta), min(t1, tb)
+        if t0 > t1:
+            return False
+    elif not box[0] <= x1 <= box[2]:
+        return False
+    if dy:
+        ta, tb = (box[1] - y1) / dy, (box[3] - y1) / dy
+        if ta > tb:
+            ta, tb = tb, ta
+        t0, t1 = max(t0, ta), min(t1, tb)
+        if t0 > t1:
+            return False
+    elif not box[1] <= y1 <= box[3]:
+        return False
+    return True
+
+
+def _points_along(
+    points: list[tuple[float, float]],
+    fractions: list[float]
+) -> dict[float, tuple[float, float, float, float]]:
+    """Point at each (ascending) fraction of a polyline's length, plus the unit direction there"""
+    if len(points) == 2:
+        # Straight edges (the common case) need no walk
+        (ax, ay), (bx, by) = points
+        dx, dy = bx - ax, by - ay
+        length = (dx * dx + dy * dy) ** 0.5 or 1
+        return {fraction: (ax + dx * fraction, ay + dy * fraction, dx / length, dy / length) for fraction in fractions}
+    lengths = [
+        ((bx - ax) ** 2 + (by - ay) ** 2) ** 0.5
+        for (ax, ay), (bx, by) in zip(points, points[1:])
+    ]
+    total = sum(lengths)
+    result = {}
+    walked = 0.0
+    segments = iter(zip(zip(points, points[1:]), lengths))
+    current = next(segments, None)
+    for fraction in fractions:
+        target = total * fraction
+        # Advance to the segment containing the target distance, skipping zero-length ones
+        while current is not None and (current[1] == 0 or walked + current[1] < target):
+            walked += current[1]
+            current = next(segments, None)
+        if current is not None:
+            ((ax, ay), (bx, by)), length = current
+            ux, uy = (bx - ax) / length, (by - ay) / length
+            result[fraction] = (ax + ux * (target - walked), ay + uy * (target - walked), ux, uy)
+        else:
+            (ax, ay), (bx, by) = points[-2], points[-1]
+            length = lengths[-1] or 1
+            result[fraction] = (bx, by, (bx - ax) / length, (by - ay) / length)
+    return result
+
+
+def place_labels(
+    labels: list[dict],
+    obstacles: list[tuple],
+    paths: list[list[tuple[float, float]]],
+    cellSize: float = 64
+) -> list[tuple[float, float]]:
+    """
+    Choose a position for each edge label that avoids shapes, other labels and other edges.
+
+    Every label tries a fixed set of candidates along its own edge (see
+    LABEL_CANDIDATES) and greedily takes the cheapest one, where overlapping
+    shapes or already placed labels costs the most, crossing another edge less,
+    and moving away from the midpoint a little. Shapes, edges and placed labels
+    live in a uniform spatial grid that only holds cells some candidate can
+    touch, so each candidate only looks at nearby items. Time per candidate
+    depends on how many edges share its cells and is bounded by
+    LABEL_COST_CAP and LABEL_SEGMENT_CHECKS.
+
+    Args:
+        labels: Dicts with 'text', 'points' (the edge polyline, which must be the
+                same list object as its entry in `paths`) and optional 'fontSize'
+        obstacles: (x1, y1, x2, y2) boxes of the diagram's shapes
+        paths: Polylines of every edge in the diagram, labelled or not
+        cellSize: Grid cell size in canvas pixels
+
+    Returns:
+        (center_x, center_y) for each label, in input order
+    """
+    # Every candidate of a label lies within label-size-plus-offset of one of the
+    # LABEL_CANDIDATES points on its edge; the squares around those points (or their
+    # common bounding box, when that covers fewer cells) bound what scoring can touch
+    fractions = sorted({fraction for fraction, _ in LABEL_CANDIDATES})
+    prepared = []
+    wanted = set()
+    for label in labels:
+        width, height = measure_text(label['text'], label.get('fontSize', 16))
+        along = _points_along(label['points'], fractions)
+        reach_x = max(width, height) / 2 + 6 + width / 2
+        reach_y = max(width, height) / 2 + 6 + height / 2
+        xs = [point[0] for point in along.values()]
+        ys = [point[1] for point in along.values()]
+        envelope = (min(xs) - reach_x, min(ys) - reach_y, max(xs) + reach_x, max(ys) + reach_y)
+        square_cells = (2 * reach_x / cellSize + 2) * (2 * reach_y / cellSize + 2)
+        envelope_cells = ((envelope[2] - envelope[0]) / cellSize + 1) * ((envelope[3] - envelope[1]) / cellSize + 1)
+        if envelope_cells <= square_cells * len(fractions):
+            wanted.update(_grid_cells(*envelope, cellSize))
+        else:
+            for px, py in zip(xs, ys):
+                wanted.update(_grid_cells(px - reach_x, py - reach_y, px + reach_x, py + reach_y, cellSize))
+        prepared.append((width, height, along))
+
+    # Shapes and edges are only indexed in cells some candidate can touch, so long
+    # edges across empty canvas cost one step per row and never enter the grid
+    wanted_in_row, wanted_in_column = {}, {}
+    for gx, gy in wanted:
+        wanted_in_row.setdefault(gy, []).append(gx)
+        wanted_in_column.setdefault(gx, []).append(gy)
+    for line in (*wanted_in_row.values(), *wanted_in_column.values()):
+        line.sort()
+
+    items = []
+    grid = {}
+
+    def add(kind, geometry, owner, cells):
+        index = len(items)
+        items.append((kind, geometry, owner))
+        for cell in cells:
+            if cell in wanted:
+                grid.setdefault(cell, []).append(index)
+
+    for box in obstacles:
+        add("box", box, None, _grid_cells(*box, cellSize))
+    for points in paths:
+        for (ax, ay), (bx, by) in zip(points, points[1:]):
+            index = len(items)
+            # Segments carry their bounding box for a cheap reject before clipping
+            items.append(("segment", ((ax, ay, bx, by), (min(ax, bx), min(ay, by), max(ax, bx), max(ay, by))), id(points)))
+            for steep, line, first, last in _segment_spans(ax, ay, bx, by, cellSize):
+                hits = (wanted_in_column if steep else wanted_in_row).get(line)
+                if not hits:
+                    continue
+                for other in hits[bisect_left(hits, first):bisect_right(hits, last)]:
+                    grid.setdefault((line, other) if steep else (other, line), []).append(index)
+
+    def score(box, cells, cost, limit, own_path, area):
+        seen = set()
+        checks = 0
+        left, top, right, bottom = box
+        for cell in cells:
+            for index in grid.get(cell, ()):
+                if index in seen:
+                    continue
+                seen.add(index)
+                kind, geometry, owner = items[index]
+                if kind == "segment":
+                    segment, (sx1, sy1, sx2, sy2) = geometry
+                    if owner == own_path or sx2 < left or sx1 > right or sy2 < top or sy1 > bottom:
+                        continue
+                    if checks == LABEL_SEGMENT_CHECKS:
+                        continue
+                    checks += 1
+                    if _segment_crosses_box(segment, box):
+                        cost += 1
+                else:
+                    cost += 10 * _overlap_area(geometry, box) / area
+                if cost >= limit:
+                    return cost
+        return cost
+
+    placements = []
+    for label, (width, height, along) in zip(labels, prepared):
+        area = width * height or 1
+        own_path = id(label['points'])
+        best = None
+        for rank, (fraction, side) in enumerate(LABEL_CANDIDATES):
+            px, py, ux, uy = along[fraction]
+            # Push the label clear of its edge along the normal
+            offset = side * (abs(uy) * width / 2 + abs(ux) * height / 2 + 6)
+            cx, cy = px - uy * offset, py + ux * offset
+            box = (cx - width / 2, cy - height / 2, cx + width / 2, cy + height / 2)
+            cells = list(_grid_cells(*box, cellSize))
+
+            # Stop scoring a candidate once it can no longer beat the best one, or once
+            # it is already hopelessly blocked; this bounds the work per label
+            limit = min(best[0], LABEL_COST_CAP) if best else LABEL_COST_CAP
+            cost = score(box, cells, rank * 0.05, limit, own_path, area)
+            if best is None or cost < best[0]:
+                best = (cost, cx, cy, box, cells)
+            if cost == 0:
+                break
+
+        _, cx, cy, box, cells = best
+        add("box", box, None, cells)
+        placements.append((cx, cy))
+
+    return placements
+
+
+def create_placed_labels(
+    labels: list[dict],
+    obstacles: list[tuple],
+    paths: list[list[tuple[float, float]]]
+) -> list[dict]:
+    """Run place_labels and emit a text element at each chosen position"""
+    return [
+        create_text(
+            cx, cy, label['text'],
+            fontSize=label.get('fontSize', 16),
+            textAlign="center",
+            verticalAlign="middle"
+        )
+        for label, (cx, cy) in zip(labels, place_labels(labels, obstacles, paths))
+    ]
+
+
+# Horizontal distance between the side lanes that carry flowchart back edges
+BACK_EDGE_LANE_SPACING = 24
+
+
+def dfs_back_edges(roots: list[str], adjacency: dict[str, list[str]]) -> set[tuple[str, str]]:
+    """
+    Back edges of an iterative depth-first search, linear in nodes + edges.
+
+    A back edge points to a node still on the DFS path (self-loops included).
+    Every cycle contains at least one, so dropping them leaves a DAG; they
+    form the feedback edge set used for layering.
+
+    Args:
+        roots: Node ids in the order DFS roots are tried (duplicates are fine)
+        adjacency: Successor ids for every node id
+
+    Returns:
+        Set of (from, to) back edges
+    """
+    visited = set()
+    on_path = set()
+    feedback = set()
+
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        on_path.add(root)
+        work = [(root, iter(adjacency[root]))]
+
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if successor not in visited:
+                    visited.add(successor)
+                    on_path.add(successor)
+                    work.append((successor, iter(adjacency[successor])))
+                    break
+                if successor in on_path:
+                    feedback.add((node, successor))
+            else:
+                work.pop()
+                on_path.discard(node)
+
+    return feedback
+
+
+def topological_order(
+    roots: list[str],
+    adjacency: dict[str, list[str]],
+    skip: set[tuple[str, str]]
+) -> list[str]:
+    """Kahn's algorithm over the graph without the `skip` edges, which must leave it acyclic"""
+    indegree = dict.fromkeys(adjacency, 0)
+    for node, successors in adjacency.items():
+        for successor in successors:
+            if (node, successor) not in skip:
+                indegree[successor] += 1
+
+    ready = [node for node in dict.fromkeys(roots) if indegree[node] == 0]
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for successor in adjacency[node]:
+            if (node, successor) in skip:
+                continue
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                ready.append(successor)
+    return order
+
+
+def next_branches(node: dict) -> list[tuple[Optional[str], str]]:
+    """
+    Normalize a node's 'next' field to (label, target_id) pairs.
+
+    'next' can be a single node id, a list of ids, or for decisions a dict of
+    branch label to node id (e.g. {'yes': 'step2', 'no': 'error'}).
+    """
+    target = node.get('next')
+    if not target:
+        return []
+    if isinstance(target, dict):
+        # Decision node with yes/no branches
+        return list(target.items())
+    if isinstance(target, list):
+        return [(None, t) for t in target]
+    # Simple connection
+    return [(None, target)]
+
+
+def create_flow_node(
+    node_type: str,
+    x: float,
+    y: float,
+    width: float,
+    height: float,
+    label: str
+) -> dict:
+    """Create the shape for a flowchart node: ellipse for start/end, diamond for decisions, else a rectangle"""
+    if node_type == 'start' or node_type == 'end':
+        return create_ellipse(
+            x, y, width, height,
+            backgroundColor="#a78bfa" if node_type == 'start' else "#8b5cf6",
+            label=label
+        )
+    if node_type == 'decision':
+        return create_diamond(
+            x, y, width, height,
+            backgroundColor="#c4b5fd",
+            label=label
+        )
+    # process
+    return create_rectangle(
+        x, y, width, height,
+        backgroundColor="#ddd6fe",
+        label=label
+    )
+
+
+@tool
 def create_advanced_flowchart(
     nodes: list[dict],
     x: float = 100,
@@ -539,7 +1389,11 @@ def create_advanced_flowchart(
     Args:
         nodes: List of node dicts with 'id', 'type', 'label', and optional 'next' for connections
                type can be: 'start', 'process', 'decision', 'end'
+               an optional 'shape' names a shape library component (see list_shape_library)
+               to draw instead of the type's default shape
                next can be a node id, or for decisions: {'yes': 'node_id', 'no': 'node_id'}
+               next may point back to an earlier node (retry loops); such edges are drawn
+               as dashed arrows along the right side of the diagram
         x: Starting X coordinate (default 100)
         y: Starting Y coordinate (default 100)
         nodeWidth: Width of each node (default 200)
@@ -562,39 +1416,29 @@ def create_advanced_flowchart(
     """
     elements = []
     node_positions = {}
+    node_boxes = []
     current_y = y
 
-    # Layout algorithm: level-based positioning
+    # Layout algorithm: level-based positioning on the flowchart with its loops broken
     levels = {}
     node_map = {node['id']: node for node in nodes}
-
-    def get_level(node_id, visited=None):
-        if visited is None:
-            visited = set()
-        if node_id in visited:
-            return 0
-        visited.add(node_id)
-
-        if node_id not in node_map:
-            return 0
-
-        node = node_map[node_id]
-        next_nodes = []
-
-        if 'next' in node:
-            if isinstance(node['next'], dict):
-                next_nodes = list(node['next'].values())
-            elif node['next']:
-                next_nodes = [node['next']]
-
-        if not next_nodes:
-            return 0
-
-        return 1 + max(get_level(n, visited.copy()) for n in next_nodes)
-
-    # Assign levels (reverse topological order)
+    adjacency = {
+        node_id: [target for _, target in next_branches(node) if target in node_map]
+        for node_id, node in node_map.items()
+    }
+    # Start nodes first so loops are broken at the edge that returns to an earlier step
+    roots = [n['id'] for n in nodes if n.get('type') == 'start'] + list(node_map)
+    feedback = dfs_back_edges(roots, adjacency)
+
+    # Height above the furthest sink over the remaining DAG, in reverse topological order
+    heights = {}
+    for node_id in reversed(topological_order(roots, adjacency, feedback)):
+        heights[node_id] = max(
+            (heights[t] + 1 for t in adjacency[node_id] if (node_id, t) not in feedback),
+            default=0
+        )
     for node in nodes:
-        node['level'] = get_level(node['id'])
+        node['level'] = heights[node['id']]
 
     # Group by level
     max_level = max(n['level'] for n in nodes) if nodes else 0
@@ -614,60 +1458,64 @@ def create_advanced_flowchart(
             node_x = start_x + i * (nodeWidth + horizontalSpacing)
             node_y = y + level * (nodeHeight + verticalSpacing)
 
-            # Create shape based on type
-            if node['type'] == 'start' or node['type'] == 'end':
-                shape = create_ellipse(
-                    node_x, node_y, nodeWidth, nodeHeight,
-                    backgroundColor="#a78bfa" if node['type'] == 'start' else "#8b5cf6",
-                    label=node['label']
-                )
-            elif node['type'] == 'decision':
-                shape = create_diamond(
-                    node_x, node_y, nodeWidth, nodeHeight,
-                    backgroundColor="#c4b5fd",
-                    label=node['label']
-                )
-            else:  # process
-                shape = create_rectangle(
-                    node_x, node_y, nodeWidth, nodeHeight,
-                    backgroundColor="#ddd6fe",
-                    label=node['label']
-                )
-
+            shape_name = node.get('shape')
+            if isinstance(shape_name, str) and shape_name in get_shape_library():
+                shape = instantiate_shape(shape_name, node_x, node_y, nodeWidth, nodeHeight, node['label'])
+            else:
+                shape = create_flow_node(node['type'], node_x, node_y, nodeWidth, nodeHeight, node['label'])
             elements.extend(shape['elements'])
+            node_boxes.append((node_x, node_y, node_x + nodeWidth, node_y + nodeHeight))
             node_positions[node['id']] = {
                 'x': node_x + nodeWidth / 2,
                 'y': node_y + nodeHeight / 2,
                 'bottom': node_y + nodeHeight,
-                'top': node_y
+                'top': node_y,
+                'right': node_x + nodeWidth
             }
 
-    # Create connections
+    # Back edges run up a lane of their own to the right of the whole diagram
+    side_x = max((box[2] for box in node_boxes), default=x) + horizontalSpacing / 2
+    back_edge_lanes = 0
+
+    # Create connections; branch labels are placed once every edge is known
+    edge_paths = []
+    edge_labels = []
     for node in nodes:
         if 'next' not in node or not node['next']:
             continue
 
         from_pos = node_positions[node['id']]
 
-        if isinstance(node['next'], dict):
-            # Decision node with yes/no branches
-            for branch, target_id in node['next'].items():
-                if target_id in node_positions:
-                    to_pos = node_positions[target_id]
-                    arrow = create_arrow(
-                        from_pos['x'],
-                        from_pos['bottom'],
-                        to_pos['x'],
-                        to_pos['top'],
-                        strokeColor="#8b5cf6",
-                        label=branch.upper()
-                    )
-                    elements.extend(arrow['elements'])
-        else:
-            # Simple connection
-            target_id = node['next']
-            if target_id in node_positions:
-                to_pos = node_positions[target_id]
+        for branch, target_id in next_branches(node):
+            if target_id not in node_positions:
+                continue
+            to_pos = node_positions[target_id]
+
+            if (node['id'], target_id) in feedback:
+                lane_x = side_x + back_edge_lanes * BACK_EDGE_LANE_SPACING
+                back_edge_lanes += 1
+                # Leave and enter through the gaps between levels so no node is crossed,
+                # then drop down the gap right of the target into its right edge, so the
+                # arrowhead never lands on the forward arrow entering its top
+                below = from_pos['bottom'] + verticalSpacing / 2
+                above = to_pos['top'] - verticalSpacing / 2
+                entry_x = to_pos['right'] + horizontalSpacing / 4
+                points = [
+                    (from_pos['x'], from_pos['bottom']),
+                    (from_pos['x'], below),
+                    (lane_x, below),
+                    (lane_x, above),
+                    (entry_x, above),
+                    (entry_x, to_pos['y']),
+                    (to_pos['right'], to_pos['y'])
+                ]
+                elements.append(create_polyline(
+                    "arrow", points,
+                    strokeColor="#8b5cf6",
+                    strokeStyle="dashed",
+                    endArrowhead="arrow"
+                ))
+            else:
                 arrow = create_arrow(
                     from_pos['x'],
                     from_pos['bottom'],
@@ -676,11 +1524,171 @@ def create_advanced_flowchart(
                     strokeColor="#8b5cf6"
                 )
                 elements.extend(arrow['elements'])
+                points = [(from_pos['x'], from_pos['bottom']), (to_pos['x'], to_pos['top'])]
+
+            edge_paths.append(points)
+            if branch:
+                edge_labels.append({'text': branch.upper(), 'points': points})
+
+    elements.extend(create_placed_labels(edge_labels, node_boxes, edge_paths))
 
     return {"elements": elements}
 
 
-@mcp.tool()
+def format_edge_label(labels: list[str], count: int = 1) -> Optional[str]:
+    """Join the distinct labels of merged edges, suffixing a count for duplicates"""
+    text = ", ".join(labels)
+    if count > 1:
+        return f"{text} ×{count}" if text else f"×{count}"
+    return text or None
+
+
+def connection_source(connection: dict) -> Optional[str]:
+    """Source id of a connection or message, accepting 'from1' as well as 'from'"""
+    # Gemini sometimes uses from1 to avoid the reserved keyword
+    return connection.get('from') or connection.get('from1')
+
+
+def bundle_connections(
+    connections: list[dict],
+    component_positions: dict[str, dict],
+    min_bundle_size: int = 2
+) -> tuple[list[dict], list[dict]]:
+    """
+    Merge duplicate connections and group fan-out/fan-in edges into bundles.
+
+    Duplicate (from, to) pairs collapse into one edge carrying a count and
+    their distinct labels. Downward edges are then grouped by shared source
+    and target layer (fan-out) or shared target and source layer (fan-in);
+    the largest groups claim their edges first, and any group left with at
+    least `min_bundle_size` edges becomes a bundle routed through one trunk.
+
+    Returns:
+        (edges, bundles) where edges are merged connections drawn on their own
+        and bundles are dicts with 'kind' ('fan_out' or 'fan_in'), 'hub' (the
+        shared component id) and 'members' (the merged edges in the bundle)
+    """
+    merged = {}
+    for conn in connections:
+        from_id = connection_source(conn)
+        to_id = conn.get('to')
+
+        if from_id not in component_positions or to_id not in component_positions:
+            continue
+
+        edge = merged.get((from_id, to_id))
+        if edge is None:
+            edge = merged[(from_id, to_id)] = {'from': from_id, 'to': to_id, 'count': 0, 'labels': []}
+        edge['count'] += 1
+        label = conn.get('label')
+        if label and label not in edge['labels']:
+            edge['labels'].append(label)
+
+    # Candidate groups; every downward edge belongs to exactly one of each kind
+    groups = {}
+    for edge in merged.values():
+        from_layer = component_positions[edge['from']]['layer']
+        to_layer = component_positions[edge['to']]['layer']
+        if from_layer >= to_layer:
+            continue
+        groups.setdefault(('fan_out', edge['from'], to_layer), []).append(edge)
+        groups.setdefault(('fan_in', edge['to'], from_layer), []).append(edge)
+
+    bundled = set()
+    bundles = []
+    # Stable sort keeps input order among equally sized groups
+    for key in sorted(groups, key=lambda k: len(groups[k]), reverse=True):
+        if len(groups[key]) < min_bundle_size:
+            break
+        members = [e for e in groups[key] if (e['from'], e['to']) not in bundled]
+        if len(members) < min_bundle_size:
+            continue
+        bundled.update((e['from'], e['to']) for e in members)
+        bundles.append({'kind': key[0], 'hub': key[1], 'members': members})
+
+    edges = [e for e in merged.values() if (e['from'], e['to']) not in bundled]
+    return edges, bundles
+
+
+def render_bundles(
+    bundles: list[dict],
+    component_positions: dict[str, dict],
+    bus_gap: Callable[[int], tuple[float, float]],
+    edge_paths: list[list[tuple[float, float]]],
+    edge_labels: list[dict],
+    strokeColor: str = "#64748b"
+) -> list[dict]:
+    """
+    Draw each bundle as one shared trunk plus a short branch per member.
+
+    Fan-out trunks run from the hub down to a horizontal bus just above the
+    target layer; fan-in trunks collect a bus just below the source layer and
+    carry a single arrow down to the hub. Bundles sharing a gap get their own
+    bus height so trunks never overlap. `bus_gap(layer)` returns the (top,
+    bottom) y range of the gap directly above `layer`.
+
+    Drawn polylines are appended to `edge_paths` and labels to `edge_labels`
+    so the caller can place all labels in one pass with place_labels().
+    """
+    elements = []
+
+    gap_keys = []
+    for bundle in bundles:
+        members = bundle['members']
+        if bundle['kind'] == 'fan_out':
+            gap_keys.append(component_positions[members[0]['to']]['layer'])
+        else:
+            gap_keys.append(component_positions[members[0]['from']]['layer'] + 1)
+    gap_totals = {}
+    for gap in gap_keys:
+        gap_totals[gap] = gap_totals.get(gap, 0) + 1
+    gap_used = {}
+
+    for bundle, gap in zip(bundles, gap_keys):
+        gap_top, gap_bottom = bus_gap(gap)
+        lane = gap_used.get(gap, 0) + 1
+        gap_used[gap] = lane
+        bus_y = gap_top + (gap_bottom - gap_top) * lane / (gap_totals[gap] + 1)
+
+        hub = component_positions[bundle['hub']]
+        members = bundle['members']
+        fan_out = bundle['kind'] == 'fan_out'
+        spokes = [component_positions[e['to'] if fan_out else e['from']] for e in members]
+        bus_left = min([hub['x']] + [p['x'] for p in spokes])
+        bus_right = max([hub['x']] + [p['x'] for p in spokes])
+        bus = [(bus_left, bus_y), (bus_right, bus_y)]
+
+        if fan_out:
+            stem = [(hub['x'], hub['bottom']), (hub['x'], bus_y)]
+            elements.append(create_polyline("line", stem + bus, strokeColor=strokeColor))
+        else:
+            stem = [(hub['x'], bus_y), (hub['x'], hub['top'])]
+            elements.append(create_polyline("arrow", bus + stem, strokeColor=strokeColor, endArrowhead="arrow"))
+        edge_paths.extend([stem, bus])
+
+        # A label every member agrees on goes on the trunk; otherwise each branch keeps its own
+        shared = all(e['labels'] == members[0]['labels'] for e in members)
+        trunk_label = format_edge_label(members[0]['labels']) if shared else None
+        if trunk_label:
+            edge_labels.append({'text': trunk_label, 'points': stem})
+
+        for edge, pos in zip(members, spokes):
+            if fan_out:
+                branch = [(pos['x'], bus_y), (pos['x'], pos['top'])]
+                elements.extend(create_arrow(*branch[0], *branch[1], strokeColor=strokeColor)['elements'])
+            else:
+                branch = [(pos['x'], pos['bottom']), (pos['x'], bus_y)]
+                elements.extend(create_line(*branch[0], *branch[1], strokeColor=strokeColor)['elements'])
+            edge_paths.append(branch)
+
+            branch_label = format_edge_label([] if shared else edge['labels'], edge['count'])
+            if branch_label:
+                edge_labels.append({'text': branch_label, 'points': branch})
+
+    return elements
+
+
+@tool
 def create_system_architecture(
     components: list[dict],
     connections: list[dict],
@@ -689,14 +1697,17 @@ def create_system_architecture(
     componentWidth: float = 180,
     componentHeight: float = 120,
     horizontalSpacing: float = 200,
-    verticalSpacing: float = 150
+    verticalSpacing: float = 150,
+    bundleEdges: bool = True
 ) -> dict:
     """
     Create a system architecture diagram with various component types.
 
     Args:
         components: List of component dicts with 'id', 'type', 'label', optional 'layer'
-                   type can be: 'client', 'server', 'database', 'api', 'cache', 'queue', 'storage', 'service'
+                   type can be: 'client', 'server', 'database', 'api', 'cache', 'queue', 'storage',
+                   'service', 'cloud', 'user', or any other shape library name (see list_shape_library);
+                   an optional 'shape' overrides the shape drawn for the type
         connections: List of connection dicts with 'from', 'to', optional 'label'
         x: Starting X coordinate (default 100)
         y: Starting Y coordinate (default 100)
@@ -704,6 +1715,8 @@ def create_system_architecture(
         componentHeight: Height of each component (default 120)
         horizontalSpacing: Space between components horizontally (default 200)
         verticalSpacing: Space between layers vertically (default 150)
+        bundleEdges: Merge duplicate connections and route fan-out/fan-in groups
+                     through shared trunks instead of one arrow each (default True)
 
     Returns:
         Excalidraw elements for a system architecture diagram
@@ -730,17 +1743,7 @@ def create_system_architecture(
     elements = []
     component_positions = {}
 
-    # Component type styling
-    type_styles = {
-        'client': {'color': '#60a5fa', 'bg': '#dbeafe', 'icon': '👤'},
-        'server': {'color': '#8b5cf6', 'bg': '#ede9fe', 'icon': '🖥️'},
-        'database': {'color': '#10b981', 'bg': '#d1fae5', 'icon': '💾'},
-        'api': {'color': '#f59e0b', 'bg': '#fef3c7', 'icon': '🔌'},
-        'cache': {'color': '#ef4444', 'bg': '#fee2e2', 'icon': '⚡'},
-        'queue': {'color': '#ec4899', 'bg': '#fce7f3', 'icon': '📬'},
-        'storage': {'color': '#14b8a6', 'bg': '#ccfbf1', 'icon': '📦'},
-        'service': {'color': '#6366f1', 'bg': '#e0e7ff', 'icon': '⚙️'}
-    }
+    library = get_shape_library()
 
     # Group components by layer
     layers = {}
@@ -760,28 +1763,13 @@ def create_system_architecture(
             comp_x = start_x + i * (componentWidth + horizontalSpacing)
             comp_y = y + layer_num * (componentHeight + verticalSpacing)
 
-            comp_type = comp.get('type', 'service')
-            style = type_styles.get(comp_type, type_styles['service'])
-
-            # Create component box
-            if comp_type == 'database':
-                # Databases are cylinders (use ellipse)
-                shape = create_ellipse(
-                    comp_x, comp_y, componentWidth, componentHeight,
-                    strokeColor=style['color'],
-                    backgroundColor=style['bg'],
-                    label=f"{style['icon']} {comp['label']}"
-                )
-            else:
-                # Others are rectangles
-                shape = create_rectangle(
-                    comp_x, comp_y, componentWidth, componentHeight,
-                    strokeColor=style['color'],
-                    backgroundColor=style['bg'],
-                    strokeStyle="solid",
-                    fillStyle="solid",
-                    label=f"{style['icon']} {comp['label']}"
-                )
+            # Components are drawn from the shape library, by explicit 'shape' or by type
+            shape_name = comp.get('shape') or comp.get('type', 'service')
+            if not isinstance(shape_name, str) or shape_name not in library:
+                shape_name = 'service'
+            shape = instantiate_shape(
+                shape_name, comp_x, comp_y, componentWidth, componentHeight, label=comp['label']
+            )
 
             elements.extend(shape['elements'])
             component_positions[comp['id']] = {
@@ -790,20 +1778,29 @@ def create_system_architecture(
                 'bottom': comp_y + componentHeight,
                 'top': comp_y,
                 'right': comp_x + componentWidth,
-                'left': comp_x
+                'left': comp_x,
+                'layer': layer_num
             }
 
-    # Create connections
-    for conn in connections:
-        # Handle both 'from' and 'from1' (Gemini sometimes uses from1 to avoid reserved keyword)
-        from_id = conn.get('from') or conn.get('from1')
-        to_id = conn.get('to')
-
-        if from_id not in component_positions or to_id not in component_positions:
+    if bundleEdges:
+        edges, bundles = bundle_connections(connections, component_positions)
+    else:
+        bundles = []
+        edges = [
+            {'from': connection_source(conn), 'to': conn.get('to'), 'count': 1,
+             'labels': [conn['label']] if conn.get('label') else []}
+            for conn in connections
+        ]
+
+    # Create connections; labels are placed once every edge is known
+    edge_paths = []
+    edge_labels = []
+    for edge in edges:
+        if edge['from'] not in component_positions or edge['to'] not in component_positions:
             continue
 
-        from_pos = component_positions[from_id]
-        to_pos = component_positions[to_id]
+        from_pos = component_positions[edge['from']]
+        to_pos = component_positions[edge['to']]
 
         # Determine connection points based on relative positions
         if from_pos['bottom'] < to_pos['top']:
@@ -823,64 +1820,476 @@ def create_system_architecture(
             start_x, start_y,
             end_x, end_y,
             strokeColor="#64748b",
-            strokeStyle="solid",
-            label=conn.get('label', None)
+            strokeStyle="solid"
         )
         elements.extend(arrow['elements'])
 
+        points = [(start_x, start_y), (end_x, end_y)]
+        edge_paths.append(points)
+        label = format_edge_label(edge['labels'], edge['count'])
+        if label:
+            edge_labels.append({'text': label, 'points': points})
+
+    def bus_gap(layer_num):
+        # Vertical gap directly above a layer
+        layer_top = y + layer_num * (componentHeight + verticalSpacing)
+        return layer_top - verticalSpacing, layer_top
+
+    elements.extend(render_bundles(bundles, component_positions, bus_gap, edge_paths, edge_labels))
+
+    component_boxes = [(p['left'], p['top'], p['right'], p['bottom']) for p in component_positions.values()]
+    elements.extend(create_placed_labels(edge_labels, component_boxes, edge_paths))
+
     return {"elements": elements}
 
 
-if __name__ == "__main__":
-    import sys
+# Activation bar width in sequence diagrams; nested activations shift by half of it
+ACTIVATION_WIDTH = 12
 
-    # For HTTP API mode, use FastAPI
-    if "--api" in sys.argv:
-        from fastapi import FastAPI
-        from fastapi.middleware.cors import CORSMiddleware
-        import uvicorn
-
-        app = FastAPI()
-
-        # Enable CORS
-        app.add_middleware(
-            CORSMiddleware,
-            allow_origins=["*"],
-            allow_credentials=True,
-            allow_methods=["*"],
-            allow_headers=["*"],
-        )
 
-        @app.post("/tools/{tool_name}")
-        async def call_tool(tool_name: str, args: dict):
-            """Call a tool by name with arguments"""
-            tools_map = {
-                "create_rectangle": create_rectangle,
-                "create_ellipse": create_ellipse,
-                "create_diamond": create_diamond,
-                "create_arrow": create_arrow,
-                "create_line": create_line,
-                "create_text_standalone": create_text_standalone,
-                "create_flowchart": create_flowchart,
-                "create_advanced_flowchart": create_advanced_flowchart,
-                "create_system_architecture": create_system_architecture,
-            }
+@tool
+def create_sequence_diagram(
+    participants: list[dict],
+    messages: list[dict],
+    x: float = 100,
+    y: float = 100,
+    participantWidth: float = 160,
+    participantHeight: float = 60,
+    participantSpacing: float = 80,
+    messageSpacing: float = 50
+) -> dict:
+    """
+    Create a UML-style sequence diagram with lifelines, messages and activation bars.
 
-            if tool_name not in tools_map:
-                return {"error": f"Tool {tool_name} not found"}
+    Args:
+        participants: List of participant dicts with 'id' and optional 'label', left to right
+        messages: List of message dicts in time order with 'from', 'to', optional 'label'
+                  and optional 'type': 'sync' (default, activates the receiver),
+                  'async' (no activation) or 'reply' (dashed, ends the sender's activation).
+                  A message whose 'from' and 'to' are the same is drawn as a self-call loop.
+        x: Starting X coordinate (default 100)
+        y: Starting Y coordinate (default 100)
+        participantWidth: Width of each participant box (default 160)
+        participantHeight: Height of each participant box (default 60)
+        participantSpacing: Space between participant boxes (default 80)
+        messageSpacing: Vertical distance between consecutive messages (default 50)
+
+    Returns:
+        Excalidraw elements for a sequence diagram
+
+    Example:
+    participants = [{"id": "user", "label": "User"}, {"id": "api", "label": "API"}, {"id": "db", "label": "Database"}]
+    messages = [
+        {"from": "user", "to": "api", "label": "POST /login"},
+        {"from": "api", "to": "db", "label": "SELECT user"},
+        {"from": "db", "to": "api", "label": "row", "type": "reply"},
+        {"from": "api", "to": "user", "label": "200 OK", "type": "reply"}
+    ]
+    """
+    lifeline_x = {}
+    headers = []
+    for i, participant in enumerate(participants):
+        if isinstance(participant, str):
+            participant = {'id': participant}
+        box_x = x + i * (participantWidth + participantSpacing)
+        lifeline_x[participant['id']] = box_x + participantWidth / 2
+        headers.extend(create_rectangle(
+            box_x, y, participantWidth, participantHeight,
+            backgroundColor="#ddd6fe",
+            label=participant.get('label', participant['id'])
+        )['elements'])
+
+    # Single pass over messages: each participant keeps a stack of open activation start ys
+    active = {pid: [] for pid in lifeline_x}
+    bars = []
+    arrows = []
+    half = ACTIVATION_WIDTH / 2
+
+    def attach_x(pid, towards_right):
+        # Edge of the participant's innermost activation bar, or its lifeline
+        depth = len(active[pid])
+        if depth == 0:
+            return lifeline_x[pid]
+        return lifeline_x[pid] + (depth if towards_right else depth - 2) * half
+
+    message_y = y + participantHeight + messageSpacing
+    for message in messages:
+        from_id = connection_source(message)
+        to_id = message.get('to')
+        if from_id not in lifeline_x or to_id not in lifeline_x:
+            continue
+
+        kind = message.get('type', 'sync')
+        label = message.get('label')
+
+        if kind == 'reply' and active[from_id]:
+            start_y = active[from_id].pop()
+            bars.append((from_id, len(active[from_id]), start_y, message_y))
+
+        if from_id == to_id:
+            # Self-call: loop out to the right and back onto the lifeline
+            start_x = attach_x(from_id, True)
+            loop_x = start_x + 40
+            return_y = message_y + messageSpacing / 2
+            arrows.append(create_polyline(
+                "arrow",
+                [(start_x, message_y), (loop_x, message_y), (loop_x, return_y), (start_x, return_y)],
+                strokeStyle="dashed" if kind == 'reply' else "solid",
+                endArrowhead="arrow"
+            ))
+            if label:
+                arrows.append(create_text(loop_x + 8, message_y, label, fontSize=16))
+            message_y += messageSpacing / 2
+        else:
+            towards_right = lifeline_x[to_id] > lifeline_x[from_id]
+            if kind == 'sync':
+                active[to_id].append(message_y)
+            start_x = attach_x(from_id, towards_right)
+            end_x = attach_x(to_id, not towards_right)
+            arrows.extend(create_arrow(
+                start_x, message_y, end_x, message_y,
+                strokeStyle="dashed" if kind == 'reply' else "solid"
+            )['elements'])
+            if label:
+                arrows.append(create_text(
+                    (start_x + end_x) / 2, message_y - 12, label,
+                    fontSize=16,
+                    textAlign="center",
+                    verticalAlign="middle"
+                ))
+
+        message_y += messageSpacing
+
+    # Close activations that never got a reply
+    for pid, stack in active.items():
+        for depth, start_y in enumerate(stack):
+            bars.append((pid, depth, start_y, message_y - messageSpacing / 2))
+
+    elements = []
+    for pid, center_x in lifeline_x.items():
+        elements.extend(create_line(
+            center_x, y + participantHeight, center_x, message_y,
+            strokeColor="#64748b",
+            strokeStyle="dashed"
+        )['elements'])
+    for pid, depth, start_y, end_y in bars:
+        elements.extend(create_rectangle(
+            lifeline_x[pid] + (depth - 1) * half, start_y,
+            ACTIVATION_WIDTH, max(end_y - start_y, half),
+            backgroundColor="#ede9fe"
+        )['elements'])
+    elements.extend(arrows)
+    elements.extend(headers)
+
+    return {"elements": elements}
+
+
+@tool
+def create_swimlane(
+    lanes: list[dict],
+    steps: list[dict],
+    x: float = 100,
+    y: float = 100,
+    laneHeaderWidth: float = 140,
+    stepWidth: float = 160,
+    stepHeight: float = 70,
+    columnSpacing: float = 60,
+    lanePadding: float = 25
+) -> dict:
+    """
+    Create a swimlane process map with one horizontal lane per actor or team.
+
+    Args:
+        lanes: List of lane dicts with 'id' and optional 'label', top to bottom
+        steps: List of step dicts in process order with 'id', 'lane', 'label',
+               optional 'type' ('start', 'process', 'decision', 'end') and optional 'next'
+               next can be a step id, a list of step ids, or for decisions: {'yes': 'step_id', 'no': 'step_id'}
+               Steps naming an unknown lane get a new lane at the bottom.
+        x: Starting X coordinate (default 100)
+        y: Starting Y coordinate (default 100)
+        laneHeaderWidth: Width of the lane title column (default 140)
+        stepWidth: Width of each step (default 160)
+        stepHeight: Minimum height of each step (default 70)
+        columnSpacing: Horizontal space between step columns (default 60)
+        lanePadding: Space above and below the steps in a lane (default 25)
+
+    Returns:
+        Excalidraw elements for a swimlane diagram
+
+    Example:
+    lanes = [{"id": "customer", "label": "Customer"}, {"id": "shop", "label": "Shop"}]
+    steps = [
+        {"id": "order", "lane": "customer", "label": "Place order", "type": "start", "next": "check"},
+        {"id": "check", "lane": "shop", "label": "In stock?", "type": "decision", "next": {"yes": "ship", "no": "refund"}},
+        {"id": "ship", "lane": "shop", "label": "Ship", "next": "receive"},
+        {"id": "refund", "lane": "customer", "label": "Get refund", "type": "end"},
+        {"id": "receive", "lane": "customer", "label": "Receive", "type": "end"}
+    ]
+    """
+    lane_ids = []
+    lane_labels = {}
+    for lane in lanes:
+        if isinstance(lane, str):
+            lane = {'id': lane}
+        lane_ids.append(lane['id'])
+        lane_labels[lane['id']] = lane.get('label', lane['id'])
+    lane_heights = {lane_id: stepHeight for lane_id in lane_ids}
+
+    # Single pass: a step goes in the first free column of its lane that is
+    # right of every earlier step pointing at it
+    next_free = {lane_id: 0 for lane_id in lane_ids}
+    min_column = {}
+    placed = []
+    for step in steps:
+        lane_id = step.get('lane')
+        if lane_id not in next_free:
+            lane_ids.append(lane_id)
+            lane_labels[lane_id] = str(lane_id)
+            lane_heights[lane_id] = stepHeight
+            next_free[lane_id] = 0
+
+        column = max(next_free[lane_id], min_column.get(step['id'], 0))
+        next_free[lane_id] = column + 1
+        for _, target_id in next_branches(step):
+            min_column[target_id] = max(min_column.get(target_id, 0), column + 1)
+
+        height = max(stepHeight, measure_text(step.get('label') or '', 20)[1] + 20)
+        lane_heights[lane_id] = max(lane_heights[lane_id], height)
+        placed.append((step, lane_id, column, height))
+
+    columns = max(next_free.values(), default=0)
+    lane_width = laneHeaderWidth + columnSpacing + columns * (stepWidth + columnSpacing)
+
+    elements = []
+    lane_centers = {}
+    lane_bands = {}
+    lane_y = y
+    for lane_id in lane_ids:
+        band_height = lane_heights[lane_id] + 2 * lanePadding
+        lane_bands[lane_id] = (lane_y, lane_y + band_height)
+        elements.extend(create_rectangle(
+            x, lane_y, lane_width, band_height,
+            strokeColor="#64748b"
+        )['elements'])
+        elements.extend(create_rectangle(
+            x, lane_y, laneHeaderWidth, band_height,
+            strokeColor="#64748b",
+            backgroundColor="#ede9fe",
+            label=lane_labels[lane_id]
+        )['elements'])
+        lane_centers[lane_id] = lane_y + band_height / 2
+        lane_y += band_height
+
+    step_boxes = {}
+    step_cells = {}
+    for step, lane_id, column, height in placed:
+        step_x = x + laneHeaderWidth + columnSpacing + column * (stepWidth + columnSpacing)
+        step_y = lane_centers[lane_id] - height / 2
+        elements.extend(create_flow_node(
+            step.get('type', 'process'), step_x, step_y, stepWidth, height, step.get('label') or ''
+        )['elements'])
+        step_boxes[step['id']] = (step_x, step_y, step_x + stepWidth, step_y + height)
+        step_cells[step['id']] = (lane_id, column)
+
+    # Orthogonal connections: straight or one elbow between neighbouring columns;
+    # edges that skip a column or go backwards run along lane padding and the
+    # gaps between columns, which no step ever occupies
+    edge_paths = []
+    edge_labels = []
+    for step, lane_id, column, _ in placed:
+        left, top, right, bottom = step_boxes[step['id']]
+        for branch, target_id in next_branches(step):
+            if target_id not in step_boxes:
+                continue
+            t_left, t_top, t_right, t_bottom = step_boxes[target_id]
+            t_lane_id, t_column = step_cells[target_id]
+            center_y, t_center_y = (top + bottom) / 2, (t_top + t_bottom) / 2
+            center_x, t_center_x = (left + right) / 2, (t_left + t_right) / 2
+
+            if t_left > right and t_column > column + 1:
+                if t_lane_id == lane_id:
+                    # Over the top of the steps in between
+                    channel_y = lane_bands[lane_id][0] + lanePadding / 2
+                    points = [(center_x, top), (center_x, channel_y), (t_center_x, channel_y), (t_center_x, t_top)]
+                else:
+                    # Down (or up) the gap after this column, then along the target
+                    # lane's padding on the side facing this step
+                    elbow_x = right + columnSpacing / 2
+                    if t_top > bottom:
+                        channel_y, t_end_y = lane_bands[t_lane_id][0] + lanePadding / 2, t_top
+                    else:
+                        channel_y, t_end_y = lane_bands[t_lane_id][1] - lanePadding / 2, t_bottom
+                    points = [(right, center_y), (elbow_x, center_y), (elbow_x, channel_y),
+                              (t_center_x, channel_y), (t_center_x, t_end_y)]
+            elif t_left > right:
+                if center_y == t_center_y:
+                    points = [(right, center_y), (t_left, t_center_y)]
+                else:
+                    elbow_x = right + columnSpacing / 2
+                    points = [(right, center_y), (elbow_x, center_y), (elbow_x, t_center_y), (t_left, t_center_y)]
+            elif t_top >= bottom or t_bottom <= top:
+                # Backwards to another lane: out along this lane's padding, across
+                # lanes in the gap before the target's column, then along the
+                # target lane's padding on the side facing this step
+                gap_x = t_left - columnSpacing / 2
+                if t_top >= bottom:
+                    start_y, channel_y = bottom, lane_bands[lane_id][1] - lanePadding / 2
+                    t_channel_y, t_end_y = lane_bands[t_lane_id][0] + lanePadding / 2, t_top
+                else:
+                    start_y, channel_y = top, lane_bands[lane_id][0] + lanePadding / 2
+                    t_channel_y, t_end_y = lane_bands[t_lane_id][1] - lanePadding / 2, t_bottom
+                points = [(center_x, start_y), (center_x, channel_y), (gap_x, channel_y),
+                          (gap_x, t_channel_y), (t_center_x, t_channel_y), (t_center_x, t_end_y)]
+            else:
+                # Backwards within a lane: loop over the top of the steps
+                channel_y = lane_bands[lane_id][0] + lanePadding / 2
+                points = [(center_x, top), (center_x, channel_y), (t_center_x, channel_y), (t_center_x, t_top)]
+
+            elements.append(create_polyline("arrow", points, strokeColor="#8b5cf6", endArrowhead="arrow"))
+            edge_paths.append(points)
+            if branch:
+                edge_labels.append({'text': branch.upper(), 'points': points})
+
+    elements.extend(create_placed_labels(edge_labels, list(step_boxes.values()), edge_paths))
+
+    return {"elements": elements}
 
-            try:
-                result = tools_map[tool_name](**args)
-                return result
-            except Exception as e:
-                return {"error": str(e)}
 
-        uvicorn.run(app, host="127.0.0.1", port=8000)
+def canonical_args_key(tool_name: str, args: dict) -> str:
+    """Stable hash of a tool call, identical for equal args regardless of key order"""
+    import hashlib
+    import json
+
+    payload = json.dumps([tool_name, args], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def run_api(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    idempotencyTtl: float = 600,
+    idempotencyCacheSize: int = 256,
+    idempotencyCacheBytes: int = 64 * 2 ** 20,
+    idempotencyMaxResultBytes: int = 4 * 2 ** 20
+) -> None:
+    """
+    Serve the registered tools over a plain HTTP API.
+
+    Concurrent calls with identical tool name and args share one computation,
+    and a request carrying an `Idempotency-Key` header replays the stored
+    result of an earlier successful call with the same key for
+    `idempotencyTtl` seconds, so clients can retry safely.
+
+    Stored results are kept as serialized JSON and bounded both by entry count
+    (`idempotencyCacheSize`) and by total size (`idempotencyCacheBytes`);
+    results over `idempotencyMaxResultBytes` are returned but not stored.
+    """
+    import asyncio
+    import json
+    import time
+    from collections import OrderedDict
+
+    from fastapi import FastAPI, Header, Response
+    from fastapi.middleware.cors import CORSMiddleware
+    import uvicorn
+
+    app = FastAPI()
+
+    # Enable CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # args hash -> task computing it, while in flight
+    inflight: dict[str, asyncio.Task] = {}
+    # idempotency key -> (args hash, expiry, serialized result), oldest first
+    completed: OrderedDict[str, tuple[str, float, bytes]] = OrderedDict()
+    completed_bytes = 0
+
+    def evict_oldest() -> None:
+        nonlocal completed_bytes
+        _, (_, _, body) = completed.popitem(last=False)
+        completed_bytes -= len(body)
+
+    def run_coalesced(tool_name: str, args: dict, args_key: str) -> asyncio.Future:
+        task = inflight.get(args_key)
+        if task is None:
+            # Tools are CPU-bound and synchronous; keep them off the event loop
+            task = asyncio.ensure_future(asyncio.to_thread(TOOLS[tool_name], **args))
+            inflight[args_key] = task
+            task.add_done_callback(lambda _: inflight.pop(args_key, None))
+        # A caller that disconnects must not cancel the computation others wait on
+        return asyncio.shield(task)
+
+    @app.post("/tools/{tool_name}")
+    async def call_tool(
+        tool_name: str,
+        args: dict,
+        idempotency_key: Optional[str] = Header(None)
+    ):
+        """Call a tool by name with arguments"""
+        nonlocal completed_bytes
+        if tool_name not in TOOLS:
+            return {"error": f"Tool {tool_name} not found"}
+
+        args_key = canonical_args_key(tool_name, args)
+
+        if idempotency_key:
+            now = time.monotonic()
+            while completed and next(iter(completed.values()))[1] < now:
+                evict_oldest()
+            stored = completed.get(idempotency_key)
+            if stored is not None:
+                if stored[0] != args_key:
+                    return {"error": "Idempotency-Key was already used with different arguments"}
+                return Response(content=stored[2], media_type="application/json")
+
+        try:
+            result = await run_coalesced(tool_name, args, args_key)
+        except Exception as e:
+            return {"error": str(e)}
+
+        if idempotency_key:
+            body = json.dumps(result, separators=(",", ":")).encode()
+            if len(body) <= idempotencyMaxResultBytes:
+                if idempotency_key in completed:
+                    completed_bytes -= len(completed.pop(idempotency_key)[2])
+                completed[idempotency_key] = (args_key, time.monotonic() + idempotencyTtl, body)
+                completed_bytes += len(body)
+                while len(completed) > idempotencyCacheSize or completed_bytes > idempotencyCacheBytes:
+                    evict_oldest()
+            return Response(content=body, media_type="application/json")
+
+        return result
+
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = 8000
+    if "--port" in sys.argv:
+        value = sys.argv[sys.argv.index("--port") + 1:][:1]
+        if not value or not value[0].isdigit() or not 0 < int(value[0]) < 65536:
+            print("usage: server.py [--api | --sse] [--port N]  (N between 1 and 65535)", file=sys.stderr)
+            sys.exit(2)
+        port = int(value[0])
+
+    # For HTTP API mode, use FastAPI
+    if "--api" in sys.argv:
+        run_api(port=port)
 
     # Check if running with --sse flag for MCP SSE transport
     elif "--sse" in sys.argv:
         # Run as HTTP server with SSE transport
-        mcp.run(transport="sse")
+        server = get_mcp()
+        server.settings.port = port
+        server.run(transport="sse")
     else:
         # Run as stdio for Claude Desktop
-        mcp.run()
+        get_mcp().run()
@@ -103,6 +103,37 @@ const tools = [
       required: ["x", "y", "text"],
     },
   },
+  {
+    name: "create_shapes_batch",
+    description: "Create many rectangles, ellipses or diamonds in one call from column arrays. Use this instead of repeated shape calls for grids, timelines or scatter layouts.",
+    parameters: {
+      type: "object",
+      properties: {
+        xs: { type: "array", items: { type: "number" }, description: "X coordinate of each shape's top-left corner" },
+        ys: { type: "array", items: { type: "number" }, description: "Y coordinate of each shape's top-left corner" },
+        widths: { type: "array", items: { type: "number" }, description: "Widths, one per shape or a single value for all (default 200)" },
+        heights: { type: "array", items: { type: "number" }, description: "Heights, one per shape or a single value for all (default 100)" },
+        labels: { type: "array", items: { type: "string" }, description: "Text label per shape (empty for none)" },
+        styles: {
+          type: "array",
+          items: {
+            type: "object",
+            properties: {
+              strokeColor: { type: "string", description: "Border color in hex" },
+              backgroundColor: { type: "string", description: "Fill color in hex or 'transparent'" },
+              strokeWidth: { type: "number", description: "Border width (default 2)" },
+              strokeStyle: { type: "string", description: "'solid', 'dashed' or 'dotted'" },
+              fillStyle: { type: "string", description: "'solid', 'hachure' or 'cross-hatch'" }
+            }
+          },
+          description: "Style per shape, or a single style for all"
+        },
+        shapeTypes: { type: "array", items: { type: "string" }, description: "'rectangle' (default), 'ellipse' or 'diamond', per shape or a single value for all" },
+        fontSize: { type: "number", description: "Font size for labels (default 20)" },
+      },
+      required: ["xs", "ys"],
+    },
+  },
   {
     name: "create_flowchart",
     description: "Create a simple vertical flowchart with connected boxes",
@@ -135,6 +166,7 @@ const tools = [
               id: { type: "string", description: "Unique identifier for the node" },
               type: { type: "string", description: "Node type: 'start', 'process', 'decision', or 'end'" },
               label: { type: "string", description: "Label text for the node" },
+              shape: { type: "string", description: "Optional shape library name to draw instead of the default for the type (see list_shape_library)" },
               next: {
                 description: "Connection to next node(s). For decisions use {yes: 'node_id', no: 'node_id'}, for others use 'node_id'"
               }
@@ -151,7 +183,7 @@ const tools = [
   },
   {
     name: "create_system_architecture",
-    description: "Create a system architecture diagram with components (client, server, database, API, cache, queue, storage, service) and their connections. Perfect for showing how different parts of a system interact.",
+    description: "Create a system architecture diagram with components (client, server, database, API, cache, queue, storage, service, cloud, user) and their connections. Components are drawn from the shape library (database cylinder, queue, cloud, ...). Perfect for showing how different parts of a system interact.",
     parameters: {
       type: "object",
       properties: {
@@ -161,7 +193,8 @@ const tools = [
             type: "object",
             properties: {
               id: { type: "string", description: "Unique identifier for the component" },
-              type: { type: "string", description: "Component type: 'client', 'server', 'database', 'api', 'cache', 'queue', 'storage', 'service'" },
+              type: { type: "string", description: "Component type: 'client', 'server', 'database', 'api', 'cache', 'queue', 'storage', 'service', 'cloud', 'user', or any shape library name" },
+              shape: { type: "string", description: "Optional shape library name to draw instead of the type's default shape (see list_shape_library)" },
               label: { type: "string", description: "Display name for the component" },
               layer: { type: "number", description: "Vertical layer/tier (0 = top, increases downward)" }
             },
@@ -188,6 +221,89 @@ const tools = [
       required: ["components", "connections"],
     },
   },
+  {
+    name: "list_shape_library",
+    description: "List the shape library names, with descriptions, that create_system_architecture components and create_advanced_flowchart nodes can use as 'type' or 'shape'",
+  },
+  {
+    name: "create_sequence_diagram",
+    description: "Create a UML-style sequence diagram with participant lifelines, messages in time order and activation bars. Use this for request/response flows between services or actors.",
+    parameters: {
+      type: "object",
+      properties: {
+        participants: {
+          type: "array",
+          items: {
+            type: "object",
+            properties: {
+              id: { type: "string", description: "Unique identifier for the participant" },
+              label: { type: "string", description: "Display name for the participant" }
+            },
+            required: ["id"]
+          },
+          description: "Participants from left to right"
+        },
+        messages: {
+          type: "array",
+          items: {
+            type: "object",
+            properties: {
+              from: { type: "string", description: "Sender participant ID" },
+              to: { type: "string", description: "Receiver participant ID (same as from for a self-call)" },
+              label: { type: "string", description: "Message text" },
+              type: { type: "string", description: "Message type: 'sync' (default), 'async' or 'reply'" }
+            },
+            required: ["from", "to"]
+          },
+          description: "Messages in time order"
+        },
+        x: { type: "number", description: "Starting X coordinate (default 100)" },
+        y: { type: "number", description: "Starting Y coordinate (default 100)" },
+      },
+      required: ["participants", "messages"],
+    },
+  },
+  {
+    name: "create_swimlane",
+    description: "Create a swimlane process map with one horizontal lane per actor or team and connected steps. Use this for cross-team processes where who does each step matters.",
+    parameters: {
+      type: "object",
+      properties: {
+        lanes: {
+          type: "array",
+          items: {
+            type: "object",
+            properties: {
+              id: { type: "string", description: "Unique identifier for the lane" },
+              label: { type: "string", description: "Lane title (actor or team)" }
+            },
+            required: ["id"]
+          },
+          description: "Lanes from top to bottom"
+        },
+        steps: {
+          type: "array",
+          items: {
+            type: "object",
+            properties: {
+              id: { type: "string", description: "Unique identifier for the step" },
+              lane: { type: "string", description: "ID of the lane the step belongs to" },
+              label: { type: "string", description: "Label text for the step" },
+              type: { type: "string", description: "Step type: 'start', 'process', 'decision', or 'end'" },
+              next: {
+                description: "Connection to next step(s). For decisions use {yes: 'step_id', no: 'step_id'}, for others use 'step_id'"
+              }
+            },
+            required: ["id", "lane", "label"]
+          },
+          description: "Steps in process order"
+        },
+        x: { type: "number", description: "Starting X coordinate (default 100)" },
+        y: { type: "number", description: "Starting Y coordinate (default 100)" },
+      },
+      required: ["lanes", "steps"],
+    },
+  },
 ];
 
 export async function POST(req: NextRequest) {
@@ -250,11 +366,15 @@ Basic Shapes:
 - create_rectangle, create_ellipse, create_diamond: shapes with optional labels
 - create_arrow, create_line: connectors between points
 - create_text_standalone: standalone text
+- create_shapes_batch: many shapes at once (grids, timelines, scatter layouts)
 
 Advanced Diagrams:
 - create_flowchart: simple vertical flowcharts
 - create_advanced_flowchart: complex workflows with decision nodes and branches
 - create_system_architecture: architecture diagrams (microservices, infrastructure, web apps)
+- list_shape_library: shape names (database, queue, cloud, user, ...) usable as a component type or node shape
+- create_sequence_diagram: message flows between participants over time
+- create_swimlane: processes split across actors or teams
 
 **Color Theme:**
 Use subtle, clean colors. Default to dark grays and blacks (#1a1a1a, #333333) with white text for a sleek, professional look.
@@ -275,6 +395,8 @@ Use subtle, clean colors. Default to dark grays and blacks (#1a1a1a, #333333) wi
     const functionCalls = response.functionCalls();
     let allElements: any[] = [];
     let toolActions: any[] = [];
+    // Results of lookup tools, sent back to the model instead of drawn
+    const lookupResults: Record<string, any> = {};
 
     if (functionCalls && functionCalls.length > 0) {
       console.group(`🤖 [API] Gemini Function Calling`);
@@ -286,6 +408,13 @@ Use subtle, clean colors. Default to dark grays and blacks (#1a1a1a, #333333) wi
         console.log("📥 Input:", call.args);
 
         try {
+          if (LOOKUP_TOOLS.has(call.name)) {
+            lookupResults[call.name] = await queryTool(call.name, call.args || {});
+            console.log("📤 Output:", lookupResults[call.name]);
+            console.groupEnd();
+            continue;
+          }
+
           const elements = await executeTool(call.name, call.args);
           console.log(`✅ Generated ${elements.length} Excalidraw element(s)`);
           console.log("📤 Output:", elements);
@@ -309,7 +438,7 @@ Use subtle, clean colors. Default to dark grays and blacks (#1a1a1a, #333333) wi
       const functionResponses = functionCalls.map((call) => ({
         functionResponse: {
           name: call.name,
-          response: { success: true },
+          response: lookupResults[call.name] ?? { success: true },
         },
       }));
 
@@ -339,22 +468,46 @@ Use subtle, clean colors. Default to dark grays and blacks (#1a1a1a, #333333) wi
   }
 }
 
-async function executeTool(toolName: string, args: any): Promise<any[]> {
-  try {
-    // Call the Python backend REST API
-    const response = await fetch(`${BACKEND_URL}/tools/${toolName}`, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify(args),
-    });
+const TOOL_CALL_ATTEMPTS = 3;
+
+// Tools that return information for the model rather than canvas elements
+const LOOKUP_TOOLS = new Set(["list_shape_library"]);
+
+async function queryTool(toolName: string, args: any): Promise<any> {
+  // One key for every attempt, so the backend replays instead of recomputing
+  const idempotencyKey = crypto.randomUUID();
+  let response: Response | null = null;
 
-    if (!response.ok) {
-      throw new Error(`Backend returned ${response.status}`);
+  for (let attempt = 1; attempt <= TOOL_CALL_ATTEMPTS; attempt++) {
+    try {
+      // Call the Python backend REST API
+      response = await fetch(`${BACKEND_URL}/tools/${toolName}`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": idempotencyKey,
+        },
+        body: JSON.stringify(args),
+      });
+      if (response.status < 500) break;
+    } catch (error) {
+      if (attempt === TOOL_CALL_ATTEMPTS) throw error;
+    }
+    if (attempt < TOOL_CALL_ATTEMPTS) {
+      await new Promise(resolve => setTimeout(resolve, 200 * attempt));
     }
+  }
+
+  if (!response || !response.ok) {
+    throw new Error(`Backend returned ${response?.status}`);
+  }
+
+  return response.json();
+}
 
-    const result = await response.json();
+async function executeTool(toolName: string, args: any): Promise<any[]> {
+  try {
+    const result = await queryTool(toolName, args);
 
     // Extract elements from response
     if (result && result.elements) {